@@ -1,10 +1,48 @@
 """CRUD operations for leads"""
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Dict, Tuple
 from supabase import Client
 
 logger = logging.getLogger(__name__)
 
+# Bulk lead inserts are sent in chunks of this many rows, up to
+# INSERT_WORKERS chunks at a time
+INSERT_CHUNK_SIZE = 500
+INSERT_WORKERS = 4
+
+
+def _existing_leads(
+    client: Client,
+    rpc: str,
+    emails: List[str],
+    user_id: str,
+    batch_id: Optional[str] = None
+) -> List[dict]:
+    """
+    Fetch the user's leads whose email is in `emails` (optionally in one batch)
+    
+    Uses the `rpc` lookup, which takes the emails in the POST body so large
+    uploads don't overflow the request URL, and falls back to an
+    ?email=in.(...) query if the RPC is unavailable (e.g. migrations 015/016
+    have not been applied)
+    """
+    try:
+        response = client.rpc(rpc, {
+            'p_user_id': user_id,
+            'p_emails': emails,
+            'p_batch_id': batch_id
+        }).execute()
+        return response.data or []
+    except Exception as rpc_error:
+        logger.warning(f"{rpc} RPC failed, falling back to an email filter query: {rpc_error}")
+    
+    query = client.table('leads').select('id, email, name, batch_id').eq('user_id', user_id)
+    if batch_id:
+        query = query.eq('batch_id', batch_id)
+    response = query.in_('email', emails).execute()
+    return response.data or []
+
 
 def check_duplicate_emails_in_batch(
     client: Client,
@@ -32,13 +70,9 @@ def check_duplicate_emails_in_batch(
         cleaned_emails = [email.lower().strip() for email in emails]
         
         # Query only leads within the specific batch
-        response = client.table('leads').select(
-            'id, email, name, batch_id'
-        ).eq('user_id', user_id).eq('batch_id', batch_id).in_(
-            'email', cleaned_emails
-        ).execute()
-        
-        existing_leads = response.data if response.data else []
+        existing_leads = _existing_leads(
+            client, 'leads_existing_in_batch', list(set(cleaned_emails)), user_id, batch_id
+        )
         
         # Build duplicate info
         duplicates = []
@@ -77,6 +111,7 @@ def insert_leads(
     Args:
         client: Supabase client (authenticated or service role)
         leads: List of lead dictionaries with email, name, phone, address
+               (tagged in place with batch_id, user_id and status)
         batch_id: Batch ID to associate leads with
         user_id: User ID (owner)
     
@@ -91,24 +126,21 @@ def insert_leads(
         if leads:
             emails_to_check = [lead['email'] for lead in leads if lead.get('email')]
             duplicate_check = check_duplicate_emails_in_batch(client, emails_to_check, user_id, batch_id)
+            duplicate_emails_set = {email.lower() for email in duplicate_check['duplicates']}
+            
+            # Filter out duplicates and tag the remaining rows in place
+            # (no per-lead dict copy on large imports)
+            extra = {'batch_id': batch_id, 'user_id': user_id, 'status': 'active'}
+            leads_to_insert_filtered = []
+            for lead in leads:
+                if lead['email'].lower() in duplicate_emails_set:
+                    continue
+                lead.update(extra)
+                leads_to_insert_filtered.append(lead)
+            
+            skipped_count = len(leads) - len(leads_to_insert_filtered)
             
             if duplicate_check['duplicates']:
-                duplicate_emails_set = {email.lower() for email in duplicate_check['duplicates']}
-                
-                # Filter out duplicates
-                leads_to_insert_filtered = [
-                    {
-                        **lead,
-                        'batch_id': batch_id,
-                        'user_id': user_id,
-                        'status': 'active',
-                    }
-                    for lead in leads 
-                    if lead['email'].lower() not in duplicate_emails_set
-                ]
-                
-                skipped_count = len(leads) - len(leads_to_insert_filtered)
-                
                 # Create detailed duplicate error messages
                 for email, info in duplicate_check['details'].items():
                     duplicate_details_formatted[email] = {
@@ -119,18 +151,6 @@ def insert_leads(
                     }
                 
                 logger.info(f"Filtered out {skipped_count} duplicate leads with detailed reasons")
-            else:
-                # Add batch_id and user_id to each lead
-                leads_to_insert_filtered = [
-                    {
-                        **lead,
-                        'batch_id': batch_id,
-                        'user_id': user_id,
-                        'status': 'active',
-                    }
-                    for lead in leads
-                ]
-                skipped_count = 0
             
             # If no leads to insert after filtering
             if not leads_to_insert_filtered:
@@ -143,72 +163,119 @@ def insert_leads(
                     "duplicate_count": len(leads)
                 }
             
-            # Try bulk insert first
-            try:
-                response = client.table('leads').insert(leads_to_insert_filtered).execute()
-                inserted_leads = response.data if response.data else []
-
-                inserted_count = len(inserted_leads)
-                logger.info(f"✅ Bulk insert successful: {inserted_count} leads inserted")
+            # Insert in bounded chunks (keeps request bodies under PostgREST
+            # limits); several chunks run concurrently on the shared client
+            chunks = [
+                leads_to_insert_filtered[i:i + INSERT_CHUNK_SIZE]
+                for i in range(0, len(leads_to_insert_filtered), INSERT_CHUNK_SIZE)
+            ]
+            if len(chunks) == 1:
+                results = [_insert_chunk(client, chunks[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=INSERT_WORKERS) as executor:
+                    results = list(executor.map(lambda rows: _insert_chunk(client, rows), chunks))
+            
+            inserted_leads = []
+            additional_skipped = 0
+            errors = 0
+            for chunk_inserted, chunk_skipped, chunk_errors in results:
+                inserted_leads.extend(chunk_inserted)
+                additional_skipped += chunk_skipped
+                errors += chunk_errors
+            
+            inserted_count = len(inserted_leads)
+            total_skipped = skipped_count + additional_skipped
+            logger.info(f"Insert summary - inserted: {inserted_count}, skipped: {total_skipped}, errors: {errors} ({len(chunks)} chunks)")
 
-                # Update batch lead_count by incrementing with inserted_count
-                try:
-                    update_batch_lead_count(client, batch_id, count=inserted_count, increment=True)
-                except Exception as e_upd:
-                    logger.warning(f"Failed to update batch lead_count after bulk insert: {e_upd}")
+            # Update batch lead_count by incrementing with inserted_count
+            try:
+                update_batch_lead_count(client, batch_id, count=inserted_count, increment=True)
+            except Exception as e_upd:
+                logger.warning(f"Failed to update batch lead_count after insert: {e_upd}")
 
-                return inserted_leads, {
-                    "inserted_count": inserted_count,
-                    "skipped": skipped_count,
-                    "errors": 0,
-                    "duplicate_details": duplicate_details_formatted if skipped_count > 0 else {},
-                    "duplicate_count": skipped_count
-                }
-            except Exception as bulk_error:
-                # Fallback: insert one by one, skip any remaining duplicates
-                logger.warning(f"Bulk insert failed, trying individual inserts: {bulk_error}")
-                inserted_leads = []
-                additional_skipped = 0
-                errors = 0
-                
-                for lead in leads_to_insert_filtered:
-                    try:
-                        response = client.table('leads').insert([lead]).execute()
-                        if response.data:
-                            inserted_leads.extend(response.data)
-                            logger.info(f"✅ Inserted lead: {lead['email']}")
-                    except Exception as lead_error:
-                        error_str = str(lead_error).lower()
-                        if "duplicate key" in error_str or "23505" in error_str:
-                            additional_skipped += 1
-                            logger.info(f"⚠️  Skipped duplicate lead: {lead['email']}")
-                        else:
-                            errors += 1
-                            logger.error(f"❌ Error inserting lead {lead['email']}: {lead_error}")
-                
-                inserted_count = len(inserted_leads)
-                total_skipped = skipped_count + additional_skipped
-                logger.info(f"Individual insert summary - inserted: {inserted_count}, skipped: {total_skipped}, errors: {errors}")
-
-                # Update batch lead_count by incrementing with inserted_count
-                try:
-                    update_batch_lead_count(client, batch_id, count=inserted_count, increment=True)
-                except Exception as e_upd:
-                    logger.warning(f"Failed to update batch lead_count after individual inserts: {e_upd}")
-
-                return inserted_leads, {
-                    "inserted_count": inserted_count,
-                    "skipped": total_skipped,
-                    "errors": errors,
-                    "duplicate_details": duplicate_details_formatted if total_skipped > 0 else {},
-                    "duplicate_count": total_skipped
-                }
+            return inserted_leads, {
+                "inserted_count": inserted_count,
+                "skipped": total_skipped,
+                "errors": errors,
+                "duplicate_details": duplicate_details_formatted if total_skipped > 0 else {},
+                "duplicate_count": total_skipped
+            }
         
     except Exception as e:
         logger.error(f"Error inserting leads: {e}")
         raise
 
 
+def _insert_chunk(client: Client, rows: List[dict]) -> Tuple[List[dict], int, int]:
+    """
+    Insert one chunk of leads, skipping rows that already exist
+    
+    Returns:
+        Tuple of (inserted_leads, skipped_count, error_count)
+    """
+    # INSERT ... ON CONFLICT (batch_id, email) DO NOTHING: duplicates are
+    # skipped by the database in the same round-trip instead of failing it
+    try:
+        response = client.table('leads').upsert(
+            rows,
+            on_conflict='batch_id,email',
+            ignore_duplicates=True
+        ).execute()
+        inserted_leads = response.data if response.data else []
+        logger.info(f"✅ Bulk insert successful: {len(inserted_leads)} leads inserted")
+        return inserted_leads, len(rows) - len(inserted_leads), 0
+    except Exception as upsert_error:
+        # e.g. the unique index from migration 013 is missing
+        logger.warning(f"Bulk upsert failed, retrying as plain insert: {upsert_error}")
+    
+    try:
+        response = client.table('leads').insert(rows).execute()
+        inserted_leads = response.data if response.data else []
+        logger.info(f"✅ Bulk insert successful: {len(inserted_leads)} leads inserted")
+        return inserted_leads, 0, 0
+    except Exception as bulk_error:
+        # Last resort: isolate the bad rows
+        logger.warning(f"Bulk insert failed, trying individual inserts: {bulk_error}")
+        return _insert_leads_individually(client, rows)
+
+
+def _is_duplicate_error(error: Exception) -> bool:
+    """True if a PostgREST error is a unique violation (SQLSTATE 23505)"""
+    code = getattr(error, 'code', None)
+    if code:
+        return code == '23505'
+    # Errors without a parsed code (e.g. non-JSON responses)
+    return "duplicate key" in str(error).lower()
+
+
+def _insert_leads_individually(client: Client, leads: List[dict]) -> Tuple[List[dict], int, int]:
+    """
+    Insert leads one by one, skipping duplicates
+    
+    Returns:
+        Tuple of (inserted_leads, skipped_count, error_count)
+    """
+    inserted_leads = []
+    skipped = 0
+    errors = 0
+    
+    for lead in leads:
+        try:
+            response = client.table('leads').insert([lead]).execute()
+            if response.data:
+                inserted_leads.extend(response.data)
+                logger.debug("✅ Inserted lead: %s", lead['email'])
+        except Exception as lead_error:
+            if _is_duplicate_error(lead_error):
+                skipped += 1
+                logger.debug("⚠️  Skipped duplicate lead: %s", lead['email'])
+            else:
+                errors += 1
+                logger.error(f"❌ Error inserting lead {lead['email']}: {lead_error}")
+    
+    return inserted_leads, skipped, errors
+
+
 def insert_single_lead(
     client: Client,
     email: str,
@@ -300,19 +367,20 @@ def check_duplicate_emails(
         Dict with duplicates list and details dict
     """
     try:
-        query = client.table('leads').select('email, name, batch_id, id').eq('user_id', user_id)
-        
-        if batch_id:
-            query = query.eq('batch_id', batch_id)
+        if not emails:
+            return {'duplicates': [], 'details': {}}
         
-        response = query.execute()
+        # Only fetch the rows matching the requested emails (stored emails are
+        # normalized to lowercase; the raw forms cover legacy rows)
+        emails_lc = [email.lower().strip() for email in emails]
+        lookup = list(set(emails_lc).union(email.strip() for email in emails))
+        rows = _existing_leads(client, 'leads_existing_for_user', lookup, user_id, batch_id)
         
-        existing_leads = {lead['email'].lower(): lead for lead in response.data}
+        existing_leads = {lead['email'].lower(): lead for lead in rows}
         duplicates = []
         details = {}
         
-        for email in emails:
-            email_lower = email.lower()
+        for email, email_lower in zip(emails, emails_lc):
             if email_lower in existing_leads:
                 duplicates.append(email)
                 details[email] = existing_leads[email_lower]
@@ -414,36 +482,23 @@ def update_lead(client: Client, lead_id: str, user_id: str, updates: dict) -> di
     try:
         logger.info(f"🔍 Attempting to update lead {lead_id} for user {user_id}")
         
-        # Verify user owns this lead
-        if not verify_lead_ownership(client, lead_id, user_id):
+        # Ownership is part of the filter, so the check and the update are one
+        # round-trip; no returned row means the lead is missing or not the user's
+        update_response = client.table('leads').update(updates).eq('id', lead_id).eq('user_id', user_id).execute()
+        
+        if not update_response.data:
             logger.error(f"Lead {lead_id} not found or does not belong to user {user_id}")
             raise ValueError("Lead not found or access denied")
         
-        # Update the lead
-        update_response = client.table('leads').update(updates).eq('id', lead_id).execute()
-        
-        logger.info(f"✅ Updated lead {lead_id}")
-        
-        if update_response.data:
-            logger.info(f"Updated lead {lead_id} with data: {update_response.data[0]}")
-            return {
-                "success": True,
-                "lead_id": lead_id,
-                "data": update_response.data[0]
-            }
-        else:
-            # Update went through even if no data returned
-            logger.info(f"✅ Lead {lead_id} updated (no data returned)")
-            return {
-                "success": True,
-                "lead_id": lead_id,
-                "data": updates
-            }
+        logger.info(f"✅ Updated lead {lead_id} with data: {update_response.data[0]}")
+        return {
+            "success": True,
+            "lead_id": lead_id,
+            "data": update_response.data[0]
+        }
     
     except Exception as e:
-        logger.error(f"Error updating lead {lead_id}: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception("Error updating lead %s: %s", lead_id, e)
         raise
 
 
@@ -462,24 +517,15 @@ def delete_lead(client: Client, lead_id: str, user_id: str) -> dict:
     try:
         logger.info(f"🔍 Attempting to delete lead {lead_id} for user {user_id}")
         
-        # Get batch_id before deletion (for lead count update)
-        batch_response = client.table('leads').select('batch_id').eq('id', lead_id).execute()
-        
-        if not batch_response.data:
-            logger.error(f"Lead {lead_id} not found")
-            raise ValueError("Lead not found")
+        # Ownership is part of the filter and the deleted row (with its
+        # batch_id) is returned, so this is a single round-trip
+        delete_response = client.table('leads').delete().eq('id', lead_id).eq('user_id', user_id).execute()
         
-        batch_id = batch_response.data[0]['batch_id']
-        
-        # Verify user owns this lead
-        if not verify_lead_ownership(client, lead_id, user_id):
-            logger.error(f"Lead {lead_id} does not belong to user {user_id}")
+        if not delete_response.data:
+            logger.error(f"Lead {lead_id} not found or does not belong to user {user_id}")
             raise ValueError("Lead not found or access denied")
         
-        logger.info(f"✅ Lead verified - batch_id: {batch_id}")
-        
-        # Delete the lead
-        delete_response = client.table('leads').delete().eq('id', lead_id).execute()
+        batch_id = delete_response.data[0]['batch_id']
         logger.info(f"✅ Lead deleted: {lead_id}")
         
         # Update batch lead count - decrement by 1
@@ -496,9 +542,7 @@ def delete_lead(client: Client, lead_id: str, user_id: str) -> dict:
         }
     
     except Exception as e:
-        logger.error(f"Error deleting lead {lead_id}: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.exception("Error deleting lead %s: %s", lead_id, e)
         raise
 
 
@@ -514,32 +558,17 @@ def get_batch_leads_count(client: Client, batch_id: str) -> int:
         Count of leads
     """
     try:
-        # Method 1: Use Supabase exact count
-        try:
-            response = (
-                client.table("leads")
-                .select("id")
-                .eq("batch_id", batch_id)
-                .execute()
-            )
-            count = response.count or 0
-            logger.info(f"🔍 Batch {batch_id}: Using count='exact' → {count} leads")
-            return count
-
-        except Exception as e1:
-            logger.warning(f"⚠️ count='exact' method failed: {e1}")
-
-            # Method 2: fallback manual count
-            response = (
-                client.table("leads")
-                .select("id")
-                .eq("batch_id", batch_id)
-                .execute()
-            )
-
-            count = len(response.data) if response.data else 0
-            logger.info(f"🔍 Batch {batch_id}: Using manual count → {count} leads")
-            return count
+        # Count-only HEAD request: PostgREST returns the total in the
+        # Content-Range header without sending any rows
+        response = (
+            client.table("leads")
+            .select("id", count="exact", head=True)
+            .eq("batch_id", batch_id)
+            .execute()
+        )
+        count = response.count or 0
+        logger.info(f"🔍 Batch {batch_id}: {count} leads")
+        return count
 
     except Exception as e:
         logger.error(f"❌ Error fetching batch lead count: {e}")
@@ -585,39 +614,30 @@ def update_batch_lead_count(
                 "batch_id": batch_id,
                 "lead_count": count
             }
+        elif increment or decrement:
+            # Atomic adjustment in one round-trip (never goes below 0)
+            delta = count if increment else -count
+            response = client.rpc('adjust_batch_lead_count', {
+                'p_batch_id': batch_id,
+                'p_delta': delta
+            }).execute()
+            new_count = response.data if isinstance(response.data, int) else 0
+            logger.info(f"📊 Adjusted batch {batch_id} lead count by {delta:+d} → {new_count}")
         else:
-            # Count is provided
-            # Get current count
-            current_batch = client.table('batches').select('lead_count').eq('id', batch_id).execute()
-            if current_batch.data:
-                current_count = current_batch.data[0].get('lead_count', 0) or 0
-            else:
-                current_count = 0
-            
-            # Calculate new count based on operation
-            if increment:
-                new_count = current_count + count
-                logger.info(f"📊 Incrementing batch {batch_id} lead count: {current_count} + {count} = {new_count}")
-            elif decrement:
-                new_count = max(0, current_count - count)  # Never go below 0
-                logger.info(f"📊 Decrementing batch {batch_id} lead count: {current_count} - {count} = {new_count}")
-            else:
-                # Replace count
-                new_count = count
-                logger.info(f"📊 Setting batch {batch_id} lead count to {count}")
-            
-            # Update the batches table
+            # Replace count
+            logger.info(f"📊 Setting batch {batch_id} lead count to {count}")
             response = client.table('batches').update({
-                'lead_count': new_count
+                'lead_count': count
             }).eq('id', batch_id).execute()
-            
-            logger.info(f"✅ Successfully updated batch {batch_id} lead_count to {new_count}")
-            
-            return {
-                "success": True,
-                "batch_id": batch_id,
-                "lead_count": new_count
-            }
+            new_count = count
+        
+        logger.info(f"✅ Successfully updated batch {batch_id} lead_count to {new_count}")
+        
+        return {
+            "success": True,
+            "batch_id": batch_id,
+            "lead_count": new_count
+        }
     except Exception as e:
         logger.error(f"❌ Error updating batch lead count for {batch_id}: {e}")
         raise
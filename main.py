@@ -5,6 +5,7 @@ import logging
 from dotenv import load_dotenv
 import os
 import gc
+import asyncio
 
 # Load environment variables FIRST
 load_dotenv()
@@ -34,7 +35,20 @@ async def lifespan(app: FastAPI):
     logger.info("✅ RealtyGenie Backend API started")
     # Force garbage collection on startup
     gc.collect()
+    # Pre-open the Mailgun connection in the background so the first send
+    # doesn't pay DNS + TLS setup
+    warm_up_task = None
+    try:
+        from services.mailgun_service import get_mailgun_service
+        warm_up_task = asyncio.create_task(asyncio.to_thread(get_mailgun_service().warm_up))
+    except Exception as e:
+        logger.warning(f"⚠️ Skipping Mailgun warm-up: {e}")
     yield
+    if warm_up_task:
+        await warm_up_task
+    from services.mailgun_service import mailgun_service
+    if mailgun_service:
+        await mailgun_service.aclose()
     logger.info("🛑 RealtyGenie Backend API shutdown")
     gc.collect()
 
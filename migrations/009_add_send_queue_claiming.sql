@@ -0,0 +1,46 @@
+-- Migration: Atomic claiming of pending campaign sends
+-- Date: 2026-10-16
+-- Description: Lets the send cron claim queue rows before sending them so that
+-- overlapping cron runs (or several workers) never send the same row twice
+
+-- Track which worker claimed a row and when
+ALTER TABLE public.campaign_send_queue
+ADD COLUMN IF NOT EXISTS claimed_by TEXT,
+ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITH TIME ZONE;
+
+-- Index for the claim query
+CREATE INDEX IF NOT EXISTS idx_campaign_send_queue_status_scheduled
+    ON public.campaign_send_queue(status, scheduled_for);
+
+-- Claim up to batch_size due rows for worker_id.
+-- Rows move pending -> sending; the caller flips them to sent/failed afterwards.
+-- Rows stuck in 'sending' for more than 30 minutes (crashed worker) are reclaimed.
+-- FOR UPDATE SKIP LOCKED lets concurrent workers claim disjoint rows.
+CREATE OR REPLACE FUNCTION public.claim_pending_batch(worker_id TEXT, batch_size INT DEFAULT 100)
+RETURNS SETOF public.campaign_send_queue
+LANGUAGE sql
+AS $$
+    UPDATE public.campaign_send_queue
+    SET status = 'sending',
+        claimed_by = worker_id,
+        claimed_at = NOW()
+    WHERE id IN (
+        SELECT id
+        FROM public.campaign_send_queue
+        WHERE scheduled_for <= NOW()
+          AND (
+              status = 'pending'
+              OR (status = 'sending' AND claimed_at < NOW() - INTERVAL '30 minutes')
+          )
+        ORDER BY scheduled_for
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING *;
+$$;
+
+COMMENT ON FUNCTION public.claim_pending_batch(TEXT, INT) IS 'Atomically claims due campaign sends for one cron worker';
+
+-- Only the send cron (service role) may claim queue rows
+REVOKE EXECUTE ON FUNCTION public.claim_pending_batch(TEXT, INT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.claim_pending_batch(TEXT, INT) TO service_role;
@@ -0,0 +1,40 @@
+-- Migration: Festive email recipients in a single query
+-- Date: 2026-10-16
+-- Description: Returns every active lead of every user who enabled a festive
+-- occasion, joined with the agent's profile, so the festive cron makes one
+-- round-trip per festival instead of one per user for profiles and leads
+
+CREATE OR REPLACE FUNCTION public.festive_recipients(fest_id TEXT)
+RETURNS TABLE(
+    user_id UUID,
+    agent_name TEXT,
+    company_name TEXT,
+    city TEXT,
+    lead_id UUID,
+    lead_email TEXT,
+    lead_name TEXT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        p.id,
+        COALESCE(p.full_name, 'Your Agent'),
+        COALESCE(NULLIF(p.company_name, ''), 'Your Company'),
+        COALESCE(p.markets[1], 'your city'),
+        l.id,
+        l.email,
+        COALESCE(l.name, 'Friend')
+    FROM public.festive_email_settings s
+    JOIN public.profiles p ON p.id = s.user_id
+    JOIN public.leads l ON l.user_id = s.user_id
+    WHERE s.festive_id = fest_id
+      AND s.enabled
+      AND l.status = 'active';
+$$;
+
+COMMENT ON FUNCTION public.festive_recipients(TEXT) IS 'Active leads and agent profile for every user who enabled the given festive occasion';
+
+-- Returns every opted-in user's leads: service role (festive cron) only
+REVOKE EXECUTE ON FUNCTION public.festive_recipients(TEXT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.festive_recipients(TEXT) TO service_role;
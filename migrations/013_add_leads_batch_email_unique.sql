@@ -0,0 +1,10 @@
+-- Migration: Unique lead email per batch
+-- Date: 2026-10-16
+-- Description: Lets bulk lead inserts skip duplicates in one request with
+-- ON CONFLICT (batch_id, email) DO NOTHING instead of per-lead inserts.
+-- Remove existing duplicate (batch_id, email) rows before running it:
+--   SELECT batch_id, email, COUNT(*) FROM public.leads
+--   GROUP BY batch_id, email HAVING COUNT(*) > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leads_batch_id_email
+    ON public.leads(batch_id, email);
@@ -0,0 +1,21 @@
+-- Migration: Atomic batch lead_count adjustment
+-- Date: 2026-10-16
+-- Description: Increments/decrements batches.lead_count in one statement so
+-- lead inserts and deletes update the count in a single round-trip without a
+-- read-modify-write race between concurrent requests
+
+CREATE OR REPLACE FUNCTION public.adjust_batch_lead_count(p_batch_id UUID, p_delta INT)
+RETURNS INT
+LANGUAGE sql
+AS $$
+    UPDATE public.batches
+    SET lead_count = GREATEST(0, COALESCE(lead_count, 0) + p_delta)
+    WHERE id = p_batch_id
+    RETURNING lead_count;
+$$;
+
+COMMENT ON FUNCTION public.adjust_batch_lead_count(UUID, INT) IS 'Atomically add p_delta (never below 0) to a batch lead_count and return the new value';
+
+-- Called by the backend with the service role; not exposed to API users
+REVOKE EXECUTE ON FUNCTION public.adjust_batch_lead_count(UUID, INT) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.adjust_batch_lead_count(UUID, INT) TO service_role;
@@ -0,0 +1,33 @@
+-- Migration: Duplicate-email lookup for lead imports
+-- Date: 2026-10-16
+-- Description: Returns the leads of a batch whose email is in the given list.
+-- Called over POST with the emails in the JSON body, so large imports don't
+-- build an oversized ?email=in.(...) URL; the lookup uses the
+-- (batch_id, email) index from migration 013
+
+CREATE OR REPLACE FUNCTION public.leads_existing_in_batch(
+    p_user_id UUID,
+    p_batch_id UUID,
+    p_emails TEXT[]
+)
+RETURNS TABLE(
+    id UUID,
+    email TEXT,
+    name TEXT,
+    batch_id UUID
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT l.id, l.email, l.name, l.batch_id
+    FROM public.leads l
+    WHERE l.batch_id = p_batch_id
+      AND l.user_id = p_user_id
+      AND l.email = ANY(p_emails);
+$$;
+
+COMMENT ON FUNCTION public.leads_existing_in_batch(UUID, UUID, TEXT[]) IS 'Leads of a batch (owned by the user) whose email is in p_emails';
+
+-- p_user_id is caller-supplied, so only the backend (service role) may call it
+REVOKE EXECUTE ON FUNCTION public.leads_existing_in_batch(UUID, UUID, TEXT[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.leads_existing_in_batch(UUID, UUID, TEXT[]) TO service_role;
@@ -0,0 +1,33 @@
+-- Migration: Duplicate-email lookup across a user's leads
+-- Date: 2026-10-16
+-- Description: Returns the user's leads whose email is in the given list,
+-- optionally limited to one batch. Like leads_existing_in_batch (015) it is
+-- called over POST with the emails in the JSON body, so checking a large
+-- upload doesn't build an oversized ?email=in.(...) URL
+
+CREATE OR REPLACE FUNCTION public.leads_existing_for_user(
+    p_user_id UUID,
+    p_emails TEXT[],
+    p_batch_id UUID DEFAULT NULL
+)
+RETURNS TABLE(
+    id UUID,
+    email TEXT,
+    name TEXT,
+    batch_id UUID
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT l.id, l.email, l.name, l.batch_id
+    FROM public.leads l
+    WHERE l.user_id = p_user_id
+      AND l.email = ANY(p_emails)
+      AND (p_batch_id IS NULL OR l.batch_id = p_batch_id);
+$$;
+
+COMMENT ON FUNCTION public.leads_existing_for_user(UUID, TEXT[], UUID) IS 'Leads owned by the user (optionally in one batch) whose email is in p_emails';
+
+-- Same access as leads_existing_in_batch: service role only
+REVOKE EXECUTE ON FUNCTION public.leads_existing_for_user(UUID, TEXT[], UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.leads_existing_for_user(UUID, TEXT[], UUID) TO service_role;
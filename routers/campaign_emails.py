@@ -59,7 +59,7 @@ async def generate_month_1_emails(request: GenerateMonth1EmailsRequest):
     Returns draft emails for user review (not saved to DB)
     """
     try:
-        emails = campaign_email_service.generate_month_1_emails(
+        emails = await campaign_email_service.generate_month_1_emails(
             campaign_id=request.campaign_id,
             campaign_name=request.campaign_name,
             tones=["professional"],  # Default tone for now
@@ -489,7 +489,7 @@ async def generate_email_drafts(request: DraftGenerationRequest):
         
         campaign_email_service = CampaignEmailService()
         
-        emails = campaign_email_service.generate_month_1_emails(
+        emails = await campaign_email_service.generate_month_1_emails(
             campaign_id=request.campaign_id,
             campaign_name=request.campaign_name,
             persona=request.persona,
@@ -7,7 +7,7 @@ import os
 from datetime import datetime, timedelta
 from services.supabase_service import get_supabase_client
 from services.gemini_service import get_gemini_service
-from services.mailgun_service import MailgunService
+from services.mailgun_service import get_mailgun_service
 
 router = APIRouter(
     prefix="/api/lead-nurture",
@@ -435,7 +435,8 @@ async def trigger_email(request: TriggerEmailRequest):
             purpose=request.purpose,
             persona=request.persona,
             short_description=request.short_description,
-            user_id=request.user_id
+            user_id=request.user_id,
+            profile=profile
         )
         
         if not email_content or 'subject' not in email_content or 'body' not in email_content:
@@ -445,16 +446,22 @@ async def trigger_email(request: TriggerEmailRequest):
             )
         
         # Initialize Mailgun service
-        mailgun_service = MailgunService()
+        mailgun_service = get_mailgun_service()
         
         # Send personalized emails to each lead
         success_count = 0
         failure_count = 0
         failure_logs = []
         
+        # Send email with CC to realtor
+        cc_emails = [realtor_email] if realtor_email else []
+        
+        messages = []
+        sent_leads = []
         for lead in all_leads:
             try:
-                lead_name = lead.get('name', 'Valued Client')
+                # leads.name is nullable, so fall back on None as well as a missing key
+                lead_name = lead.get('name') or 'Valued Client'
                 lead_email = lead.get('email')
                 
                 if not lead_email:
@@ -463,32 +470,36 @@ async def trigger_email(request: TriggerEmailRequest):
                     continue
                 
                 # Replace {name} placeholder with actual lead name
-                personalized_subject = email_content['subject'].replace('{name}', lead_name)
-                personalized_body = email_content['body'].replace('{name}', lead_name)
-                
-                # Send email with CC to realtor
-                cc_emails = [realtor_email] if realtor_email else []
-                
-                result = mailgun_service.send_email(
-                    to_email=lead_email,
-                    to_name=lead_name,
-                    subject=personalized_subject,
-                    html_body=personalized_body,
-                    cc=cc_emails,
-                    tags=[f"triggered-email-{request.purpose}"]
-                )
-                
-                if result.get('success') or result.get('status') == 'sent':
-                    success_count += 1
-                    logger.info(f"✅ Email sent to {lead_name} ({lead_email})")
-                else:
-                    failure_count += 1
-                    failure_logs.append(f"Failed to send email to {lead_name} ({lead_email}): {result.get('error', 'Unknown error')}")
-                
+                messages.append({
+                    "to_email": lead_email,
+                    "to_name": lead_name,
+                    "subject": email_content['subject'].replace('{name}', lead_name),
+                    "html_body": email_content['body'].replace('{name}', lead_name),
+                    "cc": cc_emails,
+                    "tags": [f"triggered-email-{request.purpose}"],
+                })
+                sent_leads.append((lead_name, lead_email))
+            
             except Exception as e:
                 failure_count += 1
                 failure_logs.append(f"Error sending email to {lead.get('name', 'unknown')} ({lead.get('email', 'unknown')}): {str(e)}")
-                logger.error(f"Error sending email to lead: {e}")
+                logger.error(f"Error preparing email for lead: {e}")
+        
+        # Sends run concurrently over one HTTP/2 connection instead of one
+        # blocking request per lead on the event loop
+        results = await mailgun_service.send_many(messages)
+        
+        for (lead_name, lead_email), result in zip(sent_leads, results):
+            if isinstance(result, Exception):
+                failure_count += 1
+                failure_logs.append(f"Error sending email to {lead_name} ({lead_email}): {str(result)}")
+                logger.error(f"Error sending email to lead: {result}")
+            elif result.get('success') or result.get('status') == 'sent':
+                success_count += 1
+                logger.info(f"✅ Email sent to {lead_name} ({lead_email})")
+            else:
+                failure_count += 1
+                failure_logs.append(f"Failed to send email to {lead_name} ({lead_email}): {result.get('error', 'Unknown error')}")
         
         total_count = len(all_leads)
         
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
 import logging
 import uuid
-from utils.cleaning import parse_csv_from_bytes, parse_excel_from_bytes, clean_leads_data
+from utils.cleaning import parse_csv_from_bytes, parse_excel_from_bytes, clean_leads_data, contacts_to_dataframe
 from utils.validation import is_valid_email, clean_email, clean_phone, clean_name, clean_address
 from utils.google_sheets import fetch_google_sheet_as_csv
 from services.supabase_service import get_supabase_service
@@ -206,7 +207,8 @@ async def import_from_google_sheets(
         validate_batch_id(user_id)
         
         logger.info(f"📊 Importing from Google Sheets: {sheet_url[:50]}...")
-        csv_content = fetch_google_sheet_as_csv(sheet_url)
+        # Blocking download, kept off the event loop
+        csv_content = await asyncio.to_thread(fetch_google_sheet_as_csv, sheet_url)
         
         if not csv_content:
             raise HTTPException(status_code=400, detail="Failed to fetch Google Sheet. Make sure the sheet is publicly accessible.")
@@ -312,18 +314,18 @@ async def import_from_photo(
         
         # Process image with Vision API
         vision_service = get_vision_service()
-        df = vision_service.process_image(content)
+        contacts = await vision_service.process_image(content)
         
-        logger.info(f"✅ Extracted {len(df)} contacts from image")
+        logger.info(f"✅ Extracted {len(contacts)} contacts from image")
         
-        if df.empty:
+        if not contacts:
             raise HTTPException(
                 status_code=400, 
                 detail="No contact information found in the image. Please try a clearer photo."
             )
         
         # Clean the extracted data
-        cleaned_leads, stats = clean_leads_data(df)
+        cleaned_leads, stats = clean_leads_data(contacts_to_dataframe(contacts))
         
         if not cleaned_leads:
             raise HTTPException(
@@ -1,13 +1,22 @@
 """Campaign Email Service - Handles generation, approval, and scheduling of campaign emails"""
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 import logging
+import re
 from services.supabase_service import get_supabase_client
 from services.gemini_service import GeminiService
+from services.mailgun_service import chunk_batch_recipients
 
 logger = logging.getLogger(__name__)
 
 
+# `{{placeholder}}` or `{placeholder}` (the single-brace form comes from the
+# database columns and from Gemini output); matched in one pass
+_PLACEHOLDER_RE = re.compile(
+    r"\{(\{)?(recipient_name|name|city|agent_name|company|year)(?(1)\})\}"
+)
+
+
 def replace_email_placeholders(
     text: str,
     recipient_name: str = "Recipient",
@@ -28,33 +37,18 @@ def replace_email_placeholders(
     Returns:
         Text with all placeholders replaced
     """
-    year = str(datetime.now().year)
+    if "{" not in text:
+        return text
     
-    replacements = {
-        '{{recipient_name}}': recipient_name,
-        '{recipient_name}': recipient_name,  # Support database column placeholder
-        '{{name}}': recipient_name,
-        '{name}': recipient_name,  # Support Gemini-generated placeholder
-        '{{city}}': city,
-        '{city}': city,
-        '{{agent_name}}': agent_name,
-        '{agent_name}': agent_name,
-        '{{company}}': company,
-        '{company}': company,
-        '{{year}}': year,
-        '{year}': year,
+    values = {
+        'recipient_name': recipient_name,
+        'name': recipient_name,
+        'city': city,
+        'agent_name': agent_name,
+        'company': company,
+        'year': str(datetime.now().year),
     }
-    
-    result = text
-    logger.debug(f"🔍 Before replacement: '{{name}}' count: {text.count('{name}')}")
-    for placeholder, value in replacements.items():
-        if placeholder in result:
-            logger.debug(f"🔄 Replacing '{placeholder}' with '{value}'")
-        result = result.replace(placeholder, value)
-    
-    logger.debug(f"🔍 After replacement: '{{name}}' count: {result.count('{name}')}")
-    
-    return result
+    return _PLACEHOLDER_RE.sub(lambda m: values[m.group(2)], text)
 
 # Email categories matching frontend
 MONTH_1_CATEGORIES = [
@@ -101,7 +95,7 @@ class CampaignEmailService:
         self.supabase = get_supabase_client()
         self.gemini_service = GeminiService()
     
-    def generate_month_1_emails(
+    async def generate_month_1_emails(
         self,
         campaign_id: str,
         campaign_name: str,
@@ -120,42 +114,50 @@ class CampaignEmailService:
         """
         logger.info(f"Generating Month 1 emails for campaign {campaign_id} with persona: {persona}")
         
+        campaign_context = {
+            'campaign_name': campaign_name,
+            'tones': tones,  # Pass all tones for blending
+            'objective': objective,
+            'agent_name': agent_name,
+            'company_name': company_name,
+            'target_city': target_city,
+        }
+        
+        # Generate all categories in one request; if the packed response is
+        # malformed, fall back to one concurrent request per category
+        try:
+            responses = await self.gemini_service.generate_category_emails(
+                [category['prompt'] for category in MONTH_1_CATEGORIES],
+                campaign_context
+            )
+        except ValueError as e:
+            logger.warning(f"Packed Month 1 generation failed, generating per category: {e}")
+            responses = await self.gemini_service.generate_emails_batch(
+                [(category['prompt'], campaign_context) for category in MONTH_1_CATEGORIES],
+                user_id=user_id
+            )
+        
         generated_emails = []
         
-        for category in MONTH_1_CATEGORIES:
-            try:
-                # Generate email using Gemini service (handles all prompt building)
-                email_response = self.gemini_service.generate_single_email(
-                    category_prompt=category['prompt'],
-                    campaign_context={
-                        'campaign_name': campaign_name,
-                        'tones': tones,  # Pass all tones for blending
-                        'objective': objective,
-                        'agent_name': agent_name,
-                        'company_name': company_name,
-                        'target_city': target_city,
-                    },
-                    user_id=user_id
-                )
-                
-                email = {
-                    'category_id': category['id'],
-                    'category_name': category['name'],
-                    'subject': email_response['subject'],
-                    'body': email_response['body'],
-                    'send_day': category['send_day'],
-                    'order': category['order'],
-                    'month_phase': 'month_1',
-                    'month_number': 1,
-                    'metadata': email_response.get('metadata', {}),  # Token usage
-                }
-                
-                generated_emails.append(email)
-                logger.info(f"Generated email for category: {category['id']} | Tokens: {email_response.get('metadata', {}).get('total_tokens', 'N/A')}")
-                
-            except Exception as e:
-                logger.error(f"Error generating email for category {category['id']}: {e}")
-                raise Exception(f"Failed to generate {category['name']}: {str(e)}")
+        for category, email_response in zip(MONTH_1_CATEGORIES, responses):
+            if isinstance(email_response, Exception):
+                logger.error(f"Error generating email for category {category['id']}: {email_response}")
+                raise Exception(f"Failed to generate {category['name']}: {str(email_response)}")
+            
+            email = {
+                'category_id': category['id'],
+                'category_name': category['name'],
+                'subject': email_response['subject'],
+                'body': email_response['body'],
+                'send_day': category['send_day'],
+                'order': category['order'],
+                'month_phase': 'month_1',
+                'month_number': 1,
+                'metadata': email_response.get('metadata', {}),  # Token usage
+            }
+            
+            generated_emails.append(email)
+            logger.info(f"Generated email for category: {category['id']} | Tokens: {email_response.get('metadata', {}).get('total_tokens', 'N/A')}")
         
         return generated_emails
     
@@ -255,8 +257,8 @@ class CampaignEmailService:
         Send Day 0 email instantly to all leads without queueing.
         """
         try:
-            from services.mailgun_service import MailgunService
-            mailgun_service = MailgunService()
+            from services.mailgun_service import get_mailgun_service
+            mailgun_service = get_mailgun_service()
             
             batch_id = campaign_id
             logger.info(f"📧 Sending Day 0 email instantly for Batch {batch_id}")
@@ -305,7 +307,7 @@ class CampaignEmailService:
             # Build signature once for all leads
             signature = ""
             try:
-                from services.prompts import build_email_signature, wrap_email_html
+                from services.prompts import build_email_signature
                 
                 profile_response = self.supabase.table('profiles').select(
                     'phone, email, calendly_link, full_name, years_in_business, '
@@ -352,52 +354,18 @@ class CampaignEmailService:
             except Exception as sig_error:
                 logger.warning(f"Could not build signature: {sig_error}")
             
-            # Send to each lead
-            for lead in leads:
-                try:
-                    recipient_name = lead.get('name', 'Recipient')
-                    
-                    # Replace placeholders
-                    personalized_subject = replace_email_placeholders(
-                        day_0_email['subject'],
-                        recipient_name=recipient_name,
-                        city=city,
-                        agent_name=agent_name,
-                        company=company_name,
-                    )
-                    
-                    personalized_body = replace_email_placeholders(
-                        day_0_email['body'],
-                        recipient_name=recipient_name,
-                        city=city,
-                        agent_name=agent_name,
-                        company=company_name,
-                    )
-                    
-                    # Append signature to personalized body
-                    personalized_body = personalized_body + signature
-                    
-                    # Wrap in professional HTML template
-                    personalized_body = wrap_email_html(personalized_body)
-                    
-                    logger.info(f"🔍 Final body length with signature: {len(personalized_body)} chars")
-                    
-                    logger.info(f"📧 Sending Day 0 email to {lead['email']}")
-                    
-                    result = mailgun_service.send_email(
-                        to_email=lead['email'],
-                        to_name=recipient_name,
-                        subject=personalized_subject,
-                        html_body=personalized_body,
-                        tags=['day_0', 'month_1', 'instant'],
-                    )
-                    
-                    logger.info(f"✅ Day 0 email sent to {lead['email']}")
-                    sent_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"❌ Failed to send Day 0 to {lead['email']}: {str(e)}")
-                    failed_count += 1
+            # Send to all leads in Mailgun batch calls
+            sent_count, failed_count = self._send_to_leads_batched(
+                mailgun_service,
+                leads,
+                subject=day_0_email['subject'],
+                body=day_0_email['body'],
+                signature=signature,
+                tags=['day_0', 'month_1', 'instant'],
+                city=city,
+                agent_name=agent_name,
+                company_name=company_name,
+            )
             
             logger.info(f"🚀 Day 0 instant send complete: {sent_count} sent, {failed_count} failed")
             
@@ -406,6 +374,76 @@ class CampaignEmailService:
             import traceback
             logger.error(traceback.format_exc())
     
+    @staticmethod
+    def _send_to_leads_batched(
+        mailgun_service,
+        leads: List[Dict],
+        subject: str,
+        body: str,
+        signature: str,
+        tags: List[str],
+        city: str,
+        agent_name: str,
+        company_name: str,
+    ) -> Tuple[int, int]:
+        """
+        Send one campaign email to every lead with Mailgun batch sending.
+        
+        Agent/company/city placeholders are filled in once; the recipient's
+        name becomes %recipient.name%, which Mailgun fills per recipient, so
+        each MAX_BATCH_RECIPIENTS leads cost a single API call.
+        
+        Returns:
+            (sent_count, failed_count)
+        """
+        from services.prompts import wrap_email_html
+        
+        recipient_name = "%recipient.name%"
+        subject_template = replace_email_placeholders(
+            subject,
+            recipient_name=recipient_name,
+            city=city,
+            agent_name=agent_name,
+            company=company_name,
+        )
+        body_template = replace_email_placeholders(
+            body,
+            recipient_name=recipient_name,
+            city=city,
+            agent_name=agent_name,
+            company=company_name,
+        )
+        
+        # Append signature and wrap in professional HTML template
+        body_template = wrap_email_html(body_template + signature)
+        
+        recipients = [
+            {"email": lead['email'], "name": lead.get('name') or 'Recipient'}
+            for lead in leads if lead.get('email')
+        ]
+        failed_count = len(leads) - len(recipients)
+        sent_count = 0
+        
+        # Repeated addresses go to separate chunks: recipient-variables are keyed by email
+        for chunk in chunk_batch_recipients(recipients, mailgun_service.MAX_BATCH_RECIPIENTS):
+            try:
+                result = mailgun_service.send_batch(
+                    chunk,
+                    subject=subject_template,
+                    html_body=body_template,
+                    tags=tags,
+                )
+                # send_batch drops invalid addresses; count only those actually sent
+                sent = result.get("recipient_count", len(chunk))
+                sent_count += sent
+                failed_count += len(chunk) - sent
+                logger.info(f"✅ Sent '{subject}' to {sent} leads in one batch")
+            except Exception as e:
+                failed_count += len(chunk)
+                logger.error(f"❌ Failed to send '{subject}' batch of {len(chunk)} leads: {str(e)}")
+        
+        return sent_count, failed_count
+    
     def _queue_emails_for_sending(
         self,
         campaign_id: str,  # This is actually a batch_id now
@@ -513,8 +551,8 @@ class CampaignEmailService:
         This ensures the first introduction email goes out right away when campaign launches.
         """
         try:
-            from services.mailgun_service import MailgunService
-            mailgun_service = MailgunService()
+            from services.mailgun_service import get_mailgun_service
+            mailgun_service = get_mailgun_service()
             
             # Get the Day 0 email content (campaign_id is actually batch_id)
             email_response = self.supabase.table('campaign_emails').select('subject, body, user_id').eq('batch_id', campaign_id).eq('send_day', 0).single().execute()
@@ -618,8 +656,8 @@ class CampaignEmailService:
         This removes the delay and sends the entire sequence at once.
         """
         try:
-            from services.mailgun_service import MailgunService
-            mailgun_service = MailgunService()
+            from services.mailgun_service import get_mailgun_service
+            mailgun_service = get_mailgun_service()
             
             batch_id = campaign_id
             logger.info(f"📧 Sending ALL emails immediately for Batch {batch_id}")
@@ -723,64 +761,26 @@ class CampaignEmailService:
             for email_template in all_emails:
                 logger.info(f"📧 Sending {email_template['category_name']} (Day {email_template['send_day']}) to {len(leads)} leads...")
                 
-                email_sent = 0
-                email_failed = 0
+                # Add email sequence indicator to subject
+                day_number = email_template['send_day']
+                if day_number == 0:
+                    subject = email_template['subject']
+                else:
+                    subject = f"[Email {day_number + 1}] {email_template['subject']}"
                 
-                for lead in leads:
-                    try:
-                        recipient_name = lead.get('name', 'Recipient')
-                        
-                        # Replace placeholders
-                        personalized_subject = replace_email_placeholders(
-                            email_template['subject'],
-                            recipient_name=recipient_name,
-                            city=city,
-                            agent_name=agent_name,
-                            company=company_name,
-                        )
-                        
-                        personalized_body = replace_email_placeholders(
-                            email_template['body'],
-                            recipient_name=recipient_name,
-                            city=city,
-                            agent_name=agent_name,
-                            company=company_name,
-                        )
-                        
-                        # Append signature
-                        personalized_body = personalized_body + signature
-                        
-                        from services.prompts import wrap_email_html
-                        personalized_body = wrap_email_html(personalized_body)
-                        
-                        # Add email sequence indicator to subject
-                        day_number = email_template['send_day']
-                        if day_number == 0:
-                            subject_with_sequence = personalized_subject
-                        else:
-                            subject_with_sequence = f"[Email {day_number + 1}] {personalized_subject}"
-                        
-                        result = mailgun_service.send_email(
-                            to_email=lead['email'],
-                            to_name=recipient_name,
-                            subject=subject_with_sequence,
-                            html_body=personalized_body,
-                            tags=[f'email_{day_number + 1}', 'month_1', 'immediate', email_template['category_id']],
-                        )
-                        
-                        if result.get('success'):
-                            email_sent += 1
-                            total_sent += 1
-                            logger.info(f"✅ {email_template['category_name']} sent to {lead['email']}")
-                        else:
-                            email_failed += 1
-                            total_failed += 1
-                            logger.error(f"❌ Failed to send {email_template['category_name']} to {lead['email']}")
-                        
-                    except Exception as e:
-                        email_failed += 1
-                        total_failed += 1
-                        logger.error(f"❌ Failed to send {email_template['category_name']} to {lead['email']}: {str(e)}")
+                email_sent, email_failed = self._send_to_leads_batched(
+                    mailgun_service,
+                    leads,
+                    subject=subject,
+                    body=email_template['body'],
+                    signature=signature,
+                    tags=[f'email_{day_number + 1}', 'month_1', 'immediate', email_template['category_id']],
+                    city=city,
+                    agent_name=agent_name,
+                    company_name=company_name,
+                )
+                total_sent += email_sent
+                total_failed += email_failed
                 
                 logger.info(f"📊 {email_template['category_name']}: {email_sent} sent, {email_failed} failed")
             
@@ -4,7 +4,7 @@ Handles scheduling of emails for D0, D10, D20, D30 campaign touches
 with timezone-aware send time calculations
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional
 import json
 from enum import Enum
@@ -29,6 +29,7 @@ class SendDay(int, Enum):
 class QueueStatus(str, Enum):
     """Status of emails in queue"""
     PENDING = "pending"
+    SENDING = "sending"  # Claimed by a cron worker, send in progress
     SENT = "sent"
     FAILED = "failed"
     BOUNCED = "bounced"
@@ -69,8 +70,7 @@ def populate_campaign_queue(
     
     # Ensure campaign_created_at is timezone-aware
     if not campaign_created_at.tzinfo:
-        import pytz
-        campaign_created_at = campaign_created_at.replace(tzinfo=pytz.UTC)
+        campaign_created_at = campaign_created_at.replace(tzinfo=timezone.utc)
     
     # Fetch all active leads in the batch with timezone info
     leads_response = supabase.table("leads").select("id, email, name, city, timezone").eq("batch_id", batch_id).eq("status", "active").execute()
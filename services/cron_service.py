@@ -5,18 +5,81 @@ To be run hourly via a scheduled task or cron service
 """
 
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Optional
+import asyncio
 import logging
-import json
+import os
+import re
+import socket
+
+import orjson
+from json_repair import repair_json
 
 from services.supabase_service import get_supabase_client
-from services.mailgun_service import mailgun_service
+from services.mailgun_service import MailgunService, MailgunAPIError, chunk_batch_recipients, get_mailgun_service
 from services.gemini_service import get_gemini_service
 from utils.timezone_service import is_within_send_window
+from utils.rate_limit import TokenBucket
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# First {...} object in a Gemini response (tolerates markdown fences around it)
+_JSON_OBJECT_RE = re.compile(r"\{[\s\S]*\}")
+
+# Identifies this process when claiming queue rows (see claim_pending_batch)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def _sb(query):
+    """
+    Execute a Supabase query builder off the event loop.
+    
+    supabase-py's `.execute()` is a blocking HTTPS request, so the async cron
+    entrypoints run it in a worker thread to keep the loop free for sends.
+    """
+    return await asyncio.to_thread(query.execute)
+
+
+# Mailgun sends per second allowed from a single cron run
+MAILGUN_SEND_RATE = float(os.getenv("MAILGUN_SEND_RATE", "10"))
+
+# Backoff delays (seconds) when Mailgun answers 429 Too Many Requests
+MAILGUN_RETRY_DELAYS = (2, 4, 8)
+
+
+def _get_mailgun() -> Optional[MailgunService]:
+    """Shared Mailgun service, or None if it is not configured"""
+    try:
+        return get_mailgun_service()
+    except Exception as e:
+        logger.error(f"Failed to initialize Mailgun service: {str(e)}")
+        return None
+
+
+async def _send_rate_limited(bucket: TokenBucket, send, **email_kwargs) -> Dict:
+    """
+    Run one Mailgun send call, respecting the token bucket.
+    Retries with exponential backoff when Mailgun throttles us (HTTP 429).
+    
+    Args:
+        bucket: Shared token bucket for this cron run
+        send: Mailgun method to call (`send_email` or `send_batch`)
+        **email_kwargs: Arguments forwarded to `send`
+    
+    Returns:
+        Mailgun send result dict
+    """
+    for delay in (*MAILGUN_RETRY_DELAYS, None):
+        await bucket.acquire()
+        try:
+            return await asyncio.to_thread(send, **email_kwargs)
+        except MailgunAPIError as e:
+            if e.status_code != 429 or delay is None:
+                raise
+            logger.warning(f"⏳ Mailgun rate limited, retrying in {delay}s")
+            await asyncio.sleep(delay)
+
 
 def generate_premium_festive_email(
     festival_name: str,
@@ -101,26 +164,38 @@ Generate a {festival_name} email that {recipient_name} will actually enjoy readi
             logger.warning("Empty response from Gemini")
             return None
         
-        # Parse JSON response
-        import json
-        import re
-        
         # Extract JSON from response (handle markdown code blocks)
         text = response.text.strip()
-        json_match = re.search(r'\{[\s\S]*\}', text)
-        if json_match:
-            result = json.loads(json_match.group())
-            logger.info(f"✨ Generated premium {festival_name} email via Gemini AI")
-            return result
-        else:
+        json_match = _JSON_OBJECT_RE.search(text)
+        if not json_match:
             logger.warning("Could not parse JSON from Gemini response")
             return None
+        
+        try:
+            result = orjson.loads(json_match.group())
+        except orjson.JSONDecodeError as e:
+            # Free-form (non JSON-mode) output: tolerate truncation and stray quotes
+            result = repair_json(json_match.group(), return_objects=True)
+            if not isinstance(result, dict) or not result:
+                logger.warning(f"Could not repair JSON from Gemini response: {e}")
+                return None
+            logger.warning(f"🔧 Repaired malformed festive email JSON: {e}")
+        
+        logger.info(f"✨ Generated premium {festival_name} email via Gemini AI")
+        return result
             
     except Exception as e:
         logger.error(f"Error generating festive email with Gemini: {e}")
         return None
 
 
+# Placeholder names understood by the festive/campaign templates
+TEMPLATE_PLACEHOLDERS = ("recipient_name", "city", "agent_name", "company", "year")
+
+# Any `{{placeholder}}` in TEMPLATE_PLACEHOLDERS, matched in one pass
+_PLACEHOLDER_RE = re.compile(r"\{\{(" + "|".join(TEMPLATE_PLACEHOLDERS) + r")\}\}")
+
+
 def replace_email_placeholders(
     text: str,
     recipient_name: str = "Recipient",
@@ -141,21 +216,33 @@ def replace_email_placeholders(
     Returns:
         Text with all placeholders replaced
     """
-    year = str(datetime.now().year)
+    if "{{" not in text:
+        return text
     
-    replacements = {
-        '{{recipient_name}}': recipient_name,
-        '{{city}}': city,
-        '{{agent_name}}': agent_name,
-        '{{company}}': company,
-        '{{year}}': year,
+    values = {
+        'recipient_name': recipient_name,
+        'city': city,
+        'agent_name': agent_name,
+        'company': company,
+        'year': str(datetime.now().year),
     }
+    return _PLACEHOLDER_RE.sub(lambda m: values[m.group(1)], text)
+
+
+def compile_batch_template(text: str) -> str:
+    """
+    Compile a `{{placeholder}}` template into a Mailgun batch template.
     
-    result = text
-    for placeholder, value in replacements.items():
-        result = result.replace(placeholder, value)
+    Placeholders become `%recipient.<name>%` so Mailgun substitutes the
+    per-recipient values from `recipient-variables` on its side.
     
-    return result
+    Args:
+        text: Email content with `{{placeholder}}` markers
+    
+    Returns:
+        Template string for `MailgunService.send_batch`
+    """
+    return _PLACEHOLDER_RE.sub(r"%recipient.\1%", text)
 
 
 async def send_pending_emails(dry_run: bool = False) -> Dict:
@@ -178,33 +265,54 @@ async def send_pending_emails(dry_run: bool = False) -> Dict:
     }
     
     try:
+        # Fail fast before claiming any rows if sending is impossible
+        mailgun_service = None if dry_run else _get_mailgun()
+        if not dry_run and not mailgun_service:
+            raise RuntimeError("Mailgun service not initialized")
+        
         supabase = get_supabase_client()
         
-        # Get all pending emails scheduled for now or earlier
-        now = datetime.utcnow().isoformat()
-        pending_response = supabase.table("campaign_send_queue").select("*").eq("status", "pending").lte("scheduled_for", now).order("scheduled_for", desc=False).limit(100).execute()
+        # Atomically claim pending emails scheduled for now or earlier
+        # (pending -> sending), so overlapping cron runs never send a row twice
+        if dry_run:
+            now = datetime.utcnow().isoformat()
+            pending_response = await _sb(supabase.table("campaign_send_queue").select("*").eq("status", "pending").lte("scheduled_for", now).order("scheduled_for", desc=False).limit(100))
+        else:
+            pending_response = await _sb(supabase.rpc("claim_pending_batch", {"worker_id": WORKER_ID, "batch_size": 100}))
         
         pending_emails = pending_response.data if pending_response.data else []
+        bucket = TokenBucket(MAILGUN_SEND_RATE)
         
         logger.info(f"🚀 Processing {len(pending_emails)} pending emails")
         
         for email_queue in pending_emails:
             stats["processed"] += 1
             queue_id = email_queue["id"]
+            send_day = email_queue.get("send_day", 0)
+            recipient_email = email_queue["recipient_email"]
+            recipient_name = email_queue.get("recipient_name", "Recipient")
             
             try:
-                # Check if it's time to send
-                scheduled_time = datetime.fromisoformat(email_queue["scheduled_for"].replace("Z", "+00:00"))
-                if scheduled_time > datetime.utcnow():
-                    stats["skipped"] += 1
-                    continue
+                # No need to re-check scheduled_for here: the claim above
+                # already restricted rows to scheduled_for <= now.
                 
                 # Get the email for this send_day from campaign_emails
-                email_response = supabase.table("campaign_emails").select("subject, body, user_id").eq("campaign_id", email_queue["campaign_id"]).eq("send_day", email_queue.get("send_day", 0)).limit(1).execute()
+                email_response = await _sb(supabase.table("campaign_emails").select("subject, body, user_id").eq("campaign_id", email_queue["campaign_id"]).eq("send_day", send_day).limit(1))
                 
                 if not email_response.data:
-                    logger.error(f"❌ Email not found for campaign {email_queue['campaign_id']}, send_day {email_queue.get('send_day', 0)}")
+                    error_msg = f"Email not found for campaign {email_queue['campaign_id']}, send_day {send_day}"
+                    logger.error(f"❌ {error_msg}")
                     stats["failed"] += 1
+                    stats["errors"].append(f"Queue {queue_id}: {error_msg}")
+                    # The row was claimed ('sending'); mark it failed so the
+                    # stale-claim sweep doesn't pick it up again every run
+                    try:
+                        await _sb(supabase.table("campaign_send_queue").update({
+                            "status": "failed",
+                            "error_message": error_msg[:255],
+                        }).eq("id", queue_id))
+                    except Exception as mark_error:
+                        logger.error(f"Failed to mark as failed: {str(mark_error)}")
                     continue
                 
                 email_data = email_response.data[0]
@@ -217,7 +325,7 @@ async def send_pending_emails(dry_run: bool = False) -> Dict:
                 try:
                     user_id = email_data.get('user_id')
                     if user_id:
-                        profile_response = supabase.table('profiles').select('full_name, company_name, markets').eq('id', user_id).single().execute()
+                        profile_response = await _sb(supabase.table('profiles').select('full_name, company_name, markets').eq('id', user_id).single())
                         if profile_response.data:
                             agent_name = profile_response.data.get('full_name', agent_name)
                             company_name = profile_response.data.get('brokerage', company_name)
@@ -227,8 +335,6 @@ async def send_pending_emails(dry_run: bool = False) -> Dict:
                 except Exception as e:
                     logger.warning(f"Could not fetch profile: {e}")
                 
-                recipient_name = email_queue.get('recipient_name', 'Recipient')
-                
                 # Replace placeholders
                 personalized_subject = replace_email_placeholders(
                     email_data['subject'],
@@ -247,31 +353,30 @@ async def send_pending_emails(dry_run: bool = False) -> Dict:
                 )
                 
                 if dry_run:
-                    logger.info(f"[DRY RUN] Would send to {email_queue['recipient_email']}")
+                    logger.info(f"[DRY RUN] Would send to {recipient_email}")
                     stats["sent"] += 1
                     continue
                 
                 # Send via Mailgun
-                if not mailgun_service:
-                    raise Exception("Mailgun service not initialized")
+                logger.info(f"📧 Sending Day {send_day} to {recipient_email}")
                 
-                logger.info(f"📧 Sending Day {email_queue.get('send_day', 0)} to {email_queue['recipient_email']}")
-                
-                result = mailgun_service.send_email(
-                    to_email=email_queue['recipient_email'],
+                result = await _send_rate_limited(
+                    bucket,
+                    mailgun_service.send_email,
+                    to_email=recipient_email,
                     to_name=recipient_name,
                     subject=personalized_subject,
                     html_body=personalized_body,
-                    tags=[f"day_{email_queue.get('send_day', 0)}", 'campaign'],
+                    tags=[f"day_{send_day}", 'campaign'],
                 )
                 
                 # Update queue status to sent
-                supabase.table("campaign_send_queue").update({
+                await _sb(supabase.table("campaign_send_queue").update({
                     "status": "sent",
                     "sent_at": datetime.utcnow().isoformat(),
-                }).eq("id", queue_id).execute()
+                }).eq("id", queue_id))
                 
-                logger.info(f"✅ Sent to {email_queue['recipient_email']}")
+                logger.info(f"✅ Sent to {recipient_email}")
                 stats["sent"] += 1
                 
             except Exception as e:
@@ -282,10 +387,10 @@ async def send_pending_emails(dry_run: bool = False) -> Dict:
                 
                 # Mark as failed
                 try:
-                    supabase.table("campaign_send_queue").update({
+                    await _sb(supabase.table("campaign_send_queue").update({
                         "status": "failed",
                         "error_message": str(e)[:255],
-                    }).eq("id", queue_id).execute()
+                    }).eq("id", queue_id))
                 except Exception as mark_error:
                     logger.error(f"Failed to mark as failed: {str(mark_error)}")
         
@@ -316,13 +421,19 @@ async def cleanup_old_queue_entries(days_old: int = 90) -> int:
     cutoff_date = (datetime.utcnow() - timedelta(days=days_old)).isoformat()
     
     try:
-        # Delete old sent emails
-        delete_response = supabase.table("campaign_send_queue").delete().eq("status", "sent").lt("updated_at", cutoff_date).execute()
-        
-        # Delete old failed emails (after max retries exceeded)
-        fail_delete = supabase.table("campaign_send_queue").delete().eq("status", "failed").gte("retry_count", 3).lt("updated_at", cutoff_date).execute()
+        # Delete old sent emails and old failed emails (after max retries exceeded)
+        # in a single round-trip; count="exact" returns the deleted-row count
+        # without shipping the deleted rows back
+        delete_response = await _sb(
+            supabase.table("campaign_send_queue")
+            .delete(count="exact", returning="minimal")
+            .lt("updated_at", cutoff_date)
+            .or_("status.eq.sent,and(status.eq.failed,retry_count.gte.3)")
+        )
         
-        return 0  # Return count if available from Supabase
+        deleted_count = delete_response.count or 0
+        logger.info(f"🧹 Cleaned up {deleted_count} queue entries older than {days_old} days")
+        return deleted_count
     
     except Exception as e:
         logger.error(f"Cleanup failed: {str(e)}")
@@ -485,6 +596,12 @@ Stay safe and enjoy the festivities!
     }
 }
 
+# Convert and compile the static festive templates once at import
+for _fest_data in FESTIVE_OCCASIONS.values():
+    _fest_data["template_html"] = _fest_data["template"].replace("\n", "<br>")
+    _fest_data["_subject_tmpl"] = compile_batch_template(_fest_data["subject"])
+    _fest_data["_body_tmpl"] = compile_batch_template(_fest_data["template_html"])
+
 
 async def send_festive_emails(test_month: int = None, test_day: int = None) -> Dict:
     """
@@ -530,18 +647,25 @@ async def send_festive_emails(test_month: int = None, test_day: int = None) -> D
             return stats
         
         logger.info(f"🎉 Festive occasions today: {[f[1]['name'] for f in matching_festivals]}")
+        bucket = TokenBucket(MAILGUN_SEND_RATE)
+        mailgun_service = _get_mailgun()
         
         # For each matching festival
         for fest_id, fest_data in matching_festivals:
-            # Get all users who have enabled this festival
-            settings_response = supabase.table("festive_email_settings").select("user_id").eq("festive_id", fest_id).eq("enabled", True).execute()
+            # Fetch enabled users' profiles and active leads in one round-trip
+            recipients_response = await _sb(supabase.rpc("festive_recipients", {"fest_id": fest_id}))
             
-            if not settings_response.data:
-                logger.info(f"No users have enabled {fest_data['name']}")
+            if not recipients_response.data:
+                logger.info(f"No active leads for users who enabled {fest_data['name']}")
                 continue
             
-            enabled_user_ids = [s["user_id"] for s in settings_response.data]
-            logger.info(f"Sending {fest_data['name']} emails to {len(enabled_user_ids)} users' leads")
+            recipients = recipients_response.data
+            logger.info(f"Sending {fest_data['name']} emails to {len(recipients)} leads")
+            
+            if not mailgun_service:
+                stats["emails_failed"] += len(recipients)
+                stats["errors"].append("Mailgun service not initialized")
+                continue
             
             # Generate ONE premium email for this festival (reuse for all recipients)
             logger.info(f"🤖 Generating ONE AI-powered {fest_data['name']} email template...")
@@ -559,108 +683,55 @@ async def send_festive_emails(test_month: int = None, test_day: int = None) -> D
             
             if ai_email_template and "subject" in ai_email_template and "body" in ai_email_template:
                 logger.info(f"✨ Using AI-generated template for all {fest_data['name']} emails")
-                # Store the AI-generated template
-                ai_subject_template = ai_email_template["subject"]
-                ai_body_template = ai_email_template["body"]
+                # Compile the AI-generated template once for all recipients
+                subject_tmpl = compile_batch_template(ai_email_template["subject"])
+                body_tmpl = compile_batch_template(ai_email_template["body"].replace("\n", "<br>"))
             else:
                 logger.warning(f"AI generation failed, using static template for {fest_data['name']}")
-                ai_subject_template = None
-                ai_body_template = None
+                subject_tmpl = fest_data["_subject_tmpl"]
+                body_tmpl = fest_data["_body_tmpl"]
             
-            # For each user with this festival enabled
-            for user_id in enabled_user_ids:
+            year = str(datetime.now().year)
+            
+            # Per-recipient values (agent profile is joined onto each lead)
+            batch_recipients = [
+                {
+                    "email": recipient["lead_email"],
+                    "name": recipient["lead_name"],
+                    "recipient_name": recipient["lead_name"],
+                    "city": recipient["city"],
+                    "agent_name": recipient["agent_name"],
+                    "company": recipient["company_name"],
+                    "year": year,
+                }
+                for recipient in recipients
+            ]
+            
+            # One Mailgun request per chunk of up to 1000 recipients
+            for chunk in chunk_batch_recipients(batch_recipients, mailgun_service.MAX_BATCH_RECIPIENTS):
                 try:
-                    # Get user profile for personalization
-                    profile_response = supabase.table("profiles").select("full_name, company_name, markets").eq("id", user_id).single().execute()
-                    
-                    agent_name = "Your Agent"
-                    company_name = "Your Company"
-                    city = "your city"
-                    
-                    if profile_response.data:
-                        agent_name = profile_response.data.get("full_name", agent_name)
-                        company_name = profile_response.data.get("brokerage", company_name)
-                        markets = profile_response.data.get("markets", [])
-                        if markets and len(markets) > 0:
-                            city = markets[0]
-                    
-                    # Get all active leads for this user (across all batches)
-                    leads_response = supabase.table("leads").select("id, email, name").eq("user_id", user_id).eq("status", "active").execute()
-                    
-                    if not leads_response.data:
-                        logger.info(f"No active leads for user {user_id}")
-                        continue
+                    result = await _send_rate_limited(
+                        bucket,
+                        mailgun_service.send_batch,
+                        recipients=chunk,
+                        subject=subject_tmpl,
+                        html_body=body_tmpl,
+                        tags=[fest_id, "festive", "automated"]
+                    )
                     
-                    # Send email to each lead
-                    for lead in leads_response.data:
-                        try:
-                            recipient_name = lead.get("name", "Friend")
-                            recipient_email = lead["email"]
-                            
-                            # Use the pre-generated AI template or fallback to static template
-                            if ai_subject_template and ai_body_template:
-                                # Replace placeholders in the AI-generated template
-                                subject = replace_email_placeholders(
-                                    ai_subject_template,
-                                    recipient_name=recipient_name,
-                                    city=city,
-                                    agent_name=agent_name,
-                                    company=company_name
-                                )
-                                
-                                body = replace_email_placeholders(
-                                    ai_body_template,
-                                    recipient_name=recipient_name,
-                                    city=city,
-                                    agent_name=agent_name,
-                                    company=company_name
-                                )
-                            else:
-                                # Fallback to static template
-                                subject = replace_email_placeholders(
-                                    fest_data["subject"],
-                                    recipient_name=recipient_name,
-                                    city=city,
-                                    agent_name=agent_name,
-                                    company=company_name
-                                )
-                                
-                                body = replace_email_placeholders(
-                                    fest_data["template"],
-                                    recipient_name=recipient_name,
-                                    city=city,
-                                    agent_name=agent_name,
-                                    company=company_name
-                                )
-                            
-                            # Send via Mailgun
-                            if mailgun_service:
-                                result = mailgun_service.send_email(
-                                    to_email=recipient_email,
-                                    to_name=recipient_name,
-                                    subject=subject,
-                                    html_body=body.replace("\n", "<br>"),
-                                    tags=[fest_id, "festive", "automated"]
-                                )
-                                
-                                if result.get("success"):
-                                    stats["emails_sent"] += 1
-                                    logger.info(f"✅ Sent {fest_data['name']} email to {recipient_email}")
-                                else:
-                                    stats["emails_failed"] += 1
-                                    stats["errors"].append(f"Failed to send to {recipient_email}")
-                            else:
-                                stats["emails_failed"] += 1
-                                stats["errors"].append("Mailgun service not initialized")
-                        
-                        except Exception as lead_error:
-                            stats["emails_failed"] += 1
-                            error_msg = f"Error sending to lead {lead.get('email', 'unknown')}: {str(lead_error)}"
-                            stats["errors"].append(error_msg)
-                            logger.error(error_msg)
+                    if result.get("success"):
+                        # send_batch drops invalid addresses; count only those actually sent
+                        sent = result.get("recipient_count", len(chunk))
+                        stats["emails_sent"] += sent
+                        stats["emails_failed"] += len(chunk) - sent
+                        logger.info(f"✅ Sent {fest_data['name']} email to {sent} recipients")
+                    else:
+                        stats["emails_failed"] += len(chunk)
+                        stats["errors"].append(f"Failed to send {fest_data['name']} batch of {len(chunk)} recipients")
                 
-                except Exception as user_error:
-                    error_msg = f"Error processing user {user_id}: {str(user_error)}"
+                except Exception as batch_error:
+                    stats["emails_failed"] += len(chunk)
+                    error_msg = f"Error sending {fest_data['name']} batch of {len(chunk)} recipients: {str(batch_error)}"
                     stats["errors"].append(error_msg)
                     logger.error(error_msg)
         
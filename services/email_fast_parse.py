@@ -0,0 +1,101 @@
+"""
+Schema-specialized parser for Gemini email responses.
+
+Campaign email responses always have the shape {"subject": "...", "body": "..."}.
+Instead of running a general JSON parser, this scans the payload for exactly
+that shape with plain `str.find` calls and only decodes escape sequences for
+values that contain them. Anything else returns None so the caller can fall
+back to the general parser.
+"""
+
+from typing import Optional, Tuple
+
+import orjson
+
+_WHITESPACE = " \t\r\n"
+_EXPECTED_KEYS = {"subject", "body"}
+
+
+def _skip_ws(text: str, pos: int) -> int:
+    """Return the index of the first non-whitespace character at or after pos."""
+    n = len(text)
+    while pos < n and text[pos] in _WHITESPACE:
+        pos += 1
+    return pos
+
+
+def _read_string(text: str, pos: int) -> Tuple[Optional[str], int]:
+    """
+    Read a JSON string whose opening quote is at text[pos].
+    
+    Returns:
+        (value, index after the closing quote), or (None, pos) if malformed
+    """
+    if pos >= len(text) or text[pos] != '"':
+        return None, pos
+    
+    start = pos + 1
+    end = text.find('"', start)
+    while end != -1:
+        # A quote preceded by an odd number of backslashes is escaped
+        backslashes = 0
+        i = end - 1
+        while i >= start and text[i] == "\\":
+            backslashes += 1
+            i -= 1
+        if backslashes % 2 == 0:
+            break
+        end = text.find('"', end + 1)
+    
+    if end == -1:
+        return None, pos
+    
+    segment = text[start:end]
+    if "\\" in segment:
+        try:
+            segment = orjson.loads(text[pos:end + 1])
+        except orjson.JSONDecodeError:
+            return None, pos
+    return segment, end + 1
+
+
+def parse_subject_body(text: str) -> Optional[Tuple[str, str]]:
+    """
+    Parse a `{"subject": str, "body": str}` JSON object.
+    
+    Args:
+        text: JSON payload (markdown fences already stripped)
+    
+    Returns:
+        (subject, body), or None if the payload has any other shape
+    """
+    pos = _skip_ws(text, 0)
+    if pos >= len(text) or text[pos] != "{":
+        return None
+    
+    values = {}
+    pos += 1
+    while True:
+        pos = _skip_ws(text, pos)
+        key, pos = _read_string(text, pos)
+        if key not in _EXPECTED_KEYS or key in values:
+            return None
+        
+        pos = _skip_ws(text, pos)
+        if pos >= len(text) or text[pos] != ":":
+            return None
+        
+        value, pos = _read_string(text, _skip_ws(text, pos + 1))
+        if value is None:
+            return None
+        values[key] = value
+        
+        pos = _skip_ws(text, pos)
+        if pos >= len(text):
+            return None
+        if text[pos] == ",":
+            pos += 1
+            continue
+        if text[pos] == "}" and len(values) == 2 and _skip_ws(text, pos + 1) == len(text):
+            return values["subject"], values["body"]
+        return None
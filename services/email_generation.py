@@ -3,23 +3,399 @@ Email generation logic using Gemini AI.
 Handles email content generation, parsing, and token usage tracking.
 """
 
-import json
+import asyncio
+import functools
+import io
 import logging
-from typing import Dict
-import pandas as pd
+import os
+import re
+import tempfile
+import threading
+import uuid
+from string import Template
+from typing import Dict, List, Optional, Tuple
+import orjson
+from cachetools import TTLCache
+from json_repair import repair_json
+from google.api_core.exceptions import (
+    DeadlineExceeded,
+    ResourceExhausted,
+    ServiceUnavailable,
+)
 from google.cloud import vision
-from vertexai.generative_models import GenerativeModel
+from PIL import Image, ImageOps
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from vertexai.generative_models import GenerationConfig, GenerativeModel
 
 from .prompts import (
     build_single_email_prompt,
+    build_multi_email_prompt,
     build_triggered_email_prompt,
     build_image_extraction_prompt,
+    build_image_extraction_prompt_batch,
     build_email_signature
 )
+from services.email_fast_parse import parse_subject_body
 from services.supabase_service import get_supabase_client
+from utils.rate_limit import TokenBucket
 
 logger = logging.getLogger(__name__)
 
+# Raw Gemini responses are written here for debugging when DEBUG_PERSIST_GEMINI=1.
+# Defaults to the system temp dir so nothing is written inside the (often
+# read-only) source tree.
+GEMINI_RESPONSES_DIR = os.getenv(
+    "GEMINI_RESPONSES_DIR", os.path.join(tempfile.gettempdir(), "gemini_responses")
+)
+DEBUG_PERSIST_GEMINI = os.getenv("DEBUG_PERSIST_GEMINI") == "1"
+
+
+@functools.cache
+def _responses_dir() -> str:
+    """Create the debug responses directory on first use."""
+    os.makedirs(GEMINI_RESPONSES_DIR, exist_ok=True)
+    return GEMINI_RESPONSES_DIR
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """Write via a temp file + rename so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+async def _persist_response(kind: str, prompt: str, response_text: str) -> None:
+    """Dump a raw Gemini response off the event loop (no-op unless DEBUG_PERSIST_GEMINI=1)."""
+    if not DEBUG_PERSIST_GEMINI:
+        return
+    try:
+        path = os.path.join(_responses_dir(), f"{kind}_{uuid.uuid4().hex}.json")
+        data = orjson.dumps({"kind": kind, "prompt": prompt, "response": response_text})
+        await asyncio.to_thread(_write_atomic, path, data)
+    except OSError as e:
+        logger.warning(f"Could not persist Gemini response: {e}")
+
+
+# Captures the JSON payload inside a ```json ... ``` (or bare ```) fence
+_FENCE_RE = re.compile(r"```(?:json)?\s*([\[{].*[\]}])\s*```", re.S)
+
+
+def _strip_fence(text: str) -> str:
+    """Return the JSON payload inside a markdown code fence, or the stripped text."""
+    match = _FENCE_RE.search(text)
+    return match.group(1) if match else text.strip()
+
+
+def _loads_llm_json(text: str):
+    """
+    Parse JSON returned by Gemini, stripping any markdown code fence.
+    
+    Uses orjson for the common well-formed case and falls back to json_repair
+    for truncated or slightly malformed output.
+    
+    Args:
+        text: Raw model output
+    
+    Returns:
+        Parsed JSON object (dict or list)
+    
+    Raises:
+        ValueError: If the payload cannot be parsed or repaired (orjson.JSONDecodeError)
+    """
+    payload = _strip_fence(text)
+    
+    try:
+        return orjson.loads(payload)
+    except orjson.JSONDecodeError as e:
+        repaired = repair_json(payload, return_objects=True)
+        if isinstance(repaired, (dict, list)) and repaired:
+            # Logged so the rate of malformed model output can be tracked
+            logger.warning("🔧 Repaired malformed Gemini JSON (%s, %d chars)", e, len(payload))
+            return repaired
+        logger.warning("❌ Gemini JSON could not be repaired (%s, %d chars)", e, len(payload))
+        raise
+
+
+# Profile rows and rendered signatures are cached for a few minutes:
+# generating several emails for one realtor otherwise repeats the same
+# profiles query and signature rendering for every email. Rendered signatures
+# are keyed by (user_id, hash of signature inputs) so an injected, newer
+# profile row never picks up a stale signature.
+SIGNATURE_CACHE_TTL = 300
+_profile_cache = TTLCache(maxsize=1024, ttl=SIGNATURE_CACHE_TTL)
+_signature_cache = TTLCache(maxsize=2048, ttl=600)
+_signature_cache_lock = threading.Lock()
+
+
+# Profile columns used to render the email signature
+_PROFILE_COLS = (
+    'phone, email, calendly_link, full_name, years_in_business, '
+    'brokerage_logo_url, brand_logo_url, realtor_type, '
+    'company_name, brokerage_name, markets'
+)
+
+
+def _fetch_profile_for_signature(user_id: str) -> Optional[Dict]:
+    """
+    Fetch the profile fields needed for the email signature (TTL-cached).
+    
+    Args:
+        user_id: Profile (user) ID
+    
+    Returns:
+        Profile dict, or None if the user has no profile
+    """
+    with _signature_cache_lock:
+        if user_id in _profile_cache:
+            return _profile_cache[user_id]
+    
+    supabase = get_supabase_client()
+    profile_response = supabase.table('profiles').select(
+        _PROFILE_COLS, count=None
+    ).eq('id', user_id).limit(1).single().execute()
+    
+    with _signature_cache_lock:
+        _profile_cache[user_id] = profile_response.data
+    return profile_response.data
+
+
+def _render_signature(profile: Dict, user_id: Optional[str] = None) -> str:
+    """
+    Render the HTML email signature for a profile (cached per signature inputs).
+    
+    Args:
+        profile: Profile row
+        user_id: Cache key prefix; defaults to the profile's 'id'
+    
+    Returns:
+        Signature HTML, or "" if the profile lacks name, phone or email
+    """
+    phone = profile.get('phone', '')
+    email_addr = profile.get('email', '')
+    calendly_link = profile.get('calendly_link', '')
+    full_name = profile.get('full_name', '')
+    years = profile.get('years_in_business', 0)
+    realtor_type = (profile.get('realtor_type') or '').lower()
+    company_name = profile.get('company_name', '')
+    brokerage_name = profile.get('brokerage_name', '')
+    markets = profile.get('markets', [])
+    
+    # Logo selection based on realtor type
+    if realtor_type == 'team':
+        logo_url = profile.get('brand_logo_url', '')
+    else:
+        logo_url = profile.get('brokerage_logo_url', '')
+    
+    # Display brokerage priority
+    display_brokerage = brokerage_name if brokerage_name else company_name
+    
+    if not (full_name and phone and email_addr):
+        return ""
+    
+    markets_list = markets if isinstance(markets, list) else []
+    
+    key = (
+        user_id or profile.get('id'),
+        hash((full_name, display_brokerage, phone, email_addr, calendly_link,
+              tuple(markets_list), logo_url, years)),
+    )
+    with _signature_cache_lock:
+        if key in _signature_cache:
+            return _signature_cache[key]
+    
+    experience = f"{years}+ years helping clients achieve their real estate goals" if years else None
+    
+    signature = build_email_signature(
+        realtor_name=full_name,
+        brokerage=display_brokerage,
+        phone=phone,
+        email=email_addr,
+        title="Real Estate Professional",
+        experience=experience,
+        markets=markets_list,
+        calendly_link=calendly_link if calendly_link else None,
+        logo_url=logo_url if logo_url else None
+    )
+    
+    with _signature_cache_lock:
+        _signature_cache[key] = signature
+    return signature
+
+
+# Triggered-email bodies used when Gemini output can't be parsed or the call
+# fails. {name} is left in place for per-lead personalization.
+_PARSE_FALLBACK_BODY = Template(
+    "<p>Dear {name},</p>"
+    "<p>I hope this message finds you well. I wanted to reach out regarding $purpose.</p>"
+    "<p>As your trusted real estate professional at $brokerage, "
+    "I'm committed to keeping you informed about important developments in the $markets market.</p>"
+    "<p>Please don't hesitate to reach out if you have any questions.</p>"
+    "<p>Best regards,<br/>$realtor</p>"
+)
+_ERROR_FALLBACK_BODY = Template(
+    "<p>Dear {name},</p>"
+    "<p>I hope you're doing well. I wanted to share some important information with you.</p>"
+    "<p>Thank you for your continued trust in my services.</p>"
+    "<p>Best regards,<br/>$realtor<br/>$brokerage</p>"
+)
+
+# Response schemas for Gemini JSON mode: output is constrained to these shapes,
+# so no markdown fences or structural repairs are needed in the common case
+EMAIL_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "subject": {"type": "STRING"},
+        "body": {"type": "STRING"},
+    },
+    "required": ["subject", "body"],
+}
+CONTACTS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "name": {"type": "STRING", "nullable": True},
+            "email": {"type": "STRING", "nullable": True},
+            "phone": {"type": "STRING", "nullable": True},
+            "city": {"type": "STRING", "nullable": True},
+            "address": {"type": "STRING", "nullable": True},
+        },
+    },
+}
+
+# Output token ceilings. A 100-150 word campaign email body is < 350 tokens
+# and a 200-400 word triggered email < 800, but gemini-2.5-flash counts its
+# thinking tokens against max_output_tokens, so the caps leave room for that
+# on top of the body. They still stop runaway generations early.
+EMAIL_MAX_OUTPUT_TOKENS = 2048
+TRIGGERED_MAX_OUTPUT_TOKENS = 2560
+
+TRIGGERED_GENERATION_CONFIG = GenerationConfig(
+    max_output_tokens=TRIGGERED_MAX_OUTPUT_TOKENS,
+    candidate_count=1,
+    response_mime_type="application/json",
+    response_schema=EMAIL_SCHEMA,
+)
+CONTACTS_GENERATION_CONFIG = GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=CONTACTS_SCHEMA,
+)
+CONTACTS_BATCH_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"pages": {"type": "ARRAY", "items": CONTACTS_SCHEMA}},
+    "required": ["pages"],
+}
+CONTACTS_BATCH_GENERATION_CONFIG = GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=CONTACTS_BATCH_SCHEMA,
+)
+
+# Fields of each contact dict built from image extraction
+CONTACT_COLUMNS = ["name", "email", "phone", "city", "address"]
+
+
+def _extract_contact_rows(obj) -> List[Dict]:
+    """
+    Turn parsed contact JSON (object or list of objects) into dicts holding
+    exactly CONTACT_COLUMNS.
+    """
+    if isinstance(obj, dict):
+        obj = [obj]
+    return [{col: r.get(col) for col in CONTACT_COLUMNS} for r in obj if isinstance(r, dict)]
+
+
+# Transient Google API errors (429 quota, 503 unavailable, 504 deadline) that
+# are retried with jittered exponential backoff
+RETRYABLE_ERRORS = (ResourceExhausted, ServiceUnavailable, DeadlineExceeded)
+
+
+def _retrying() -> AsyncRetrying:
+    """Retry policy shared by all Gemini and Vision calls."""
+    return AsyncRetrying(
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
+        wait=wait_random_exponential(multiplier=0.5, max=30),
+        stop=stop_after_attempt(5),
+        reraise=True,
+    )
+
+
+# gRPC channel options for long-lived Google API channels: ping every 30s so
+# load balancers don't silently drop idle connections
+GRPC_KEEPALIVE_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    # Keep pinging an idle channel and keep it open for up to 10 minutes
+    # between bursts (e.g. an image upload followed by campaign generation)
+    ("grpc.http2.max_pings_without_data", 0),
+    ("grpc.max_connection_idle_ms", 600000),
+]
+
+# Vision accepts at most 16 images per batch_annotate_images request
+VISION_BATCH_SIZE = 16
+
+# Phone photos are downscaled before OCR; Vision reads text just as well at
+# this size and uploads/processes far fewer bytes
+OCR_MAX_EDGE = 1600
+OCR_JPEG_QUALITY = 85
+OCR_MIN_BYTES = 800_000
+
+# OCR text of several images is structured in one Gemini request, up to this
+# many pages / characters per request (keeps output well inside the model limits)
+CONTACTS_BATCH_MAX_PAGES = 15
+CONTACTS_BATCH_MAX_CHARS = 8000
+
+
+def _group_pages(texts: List[Optional[str]]) -> List[List[int]]:
+    """Group the indexes of non-empty page texts into contact-extraction batches."""
+    groups: List[List[int]] = []
+    current: List[int] = []
+    size = 0
+    for index, text in enumerate(texts):
+        if not text:
+            continue
+        if current and (len(current) >= CONTACTS_BATCH_MAX_PAGES or size + len(text) > CONTACTS_BATCH_MAX_CHARS):
+            groups.append(current)
+            current, size = [], 0
+        current.append(index)
+        size += len(text)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _flatten_to_rgb(img: Image.Image) -> Image.Image:
+    """RGB copy of an image; transparent areas become white instead of black."""
+    if img.mode == "P" and "transparency" in img.info:
+        img = img.convert("RGBA")
+    if img.mode in ("RGBA", "LA"):
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def _preprocess_for_ocr(image_bytes: bytes) -> bytes:
+    """
+    Downscale a large image to OCR_MAX_EDGE on its long edge and re-encode it
+    as JPEG. The EXIF orientation is applied first (the JPEG is saved without
+    it) and transparent images are flattened onto white, so rotated phone
+    photos and dark text on transparent PNGs still read correctly. Small
+    uploads and anything Pillow can't decode (e.g. PDFs) are returned unchanged.
+    """
+    if len(image_bytes) < OCR_MIN_BYTES:
+        return image_bytes
+    try:
+        img = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+        img.thumbnail((OCR_MAX_EDGE, OCR_MAX_EDGE), Image.LANCZOS)
+        buf = io.BytesIO()
+        _flatten_to_rgb(img).save(buf, "JPEG", quality=OCR_JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not downscale image for OCR, sending original: {e}")
+        return image_bytes
+    return buf.getvalue() if buf.tell() < len(image_bytes) else image_bytes
+
 
 class EmailGenerator:
     """
@@ -27,68 +403,309 @@ class EmailGenerator:
     Separated from GeminiService for better organization.
     """
     
-    def __init__(self, model: GenerativeModel, vision_client=None):
+    def __init__(
+        self,
+        model: GenerativeModel,
+        vision_client=None,
+        max_concurrency: int = 10,
+        rpm: int = 500,
+        credentials=None
+    ):
         """
         Initialize email generator with Gemini model.
         
         Args:
             model: Initialized Gemini GenerativeModel instance
-            vision_client: Optional Vision API client for image processing
+            vision_client: Optional Vision API async client (created on first use if omitted)
+            max_concurrency: Maximum number of in-flight async Gemini calls
+            rpm: Maximum Gemini requests per minute (Vertex quota)
+            credentials: Google credentials for the Vision client (None = ADC)
         """
         self.model = model
         self.vision_client = vision_client
+        self._credentials = credentials
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self._limiter = TokenBucket(rpm / 60)
+        self._generation_config = GenerationConfig(**self.GENERATION_CONFIG)
+    
+    async def _generate_content_async(self, prompt: str, **kwargs):
+        """
+        Call `generate_content_async` within the concurrency and rate limits.
+        Transient errors (RETRYABLE_ERRORS) are retried with jittered
+        exponential backoff; each retry re-enters the limits.
+        """
+        async for attempt in _retrying():
+            with attempt:
+                await self._limiter.acquire()
+                async with self._sem:
+                    return await self.model.generate_content_async(prompt, **kwargs)
+    
+    async def _stream_text_async(self, prompt: str, **kwargs) -> Tuple[str, object]:
+        """
+        Stream a Gemini response within the concurrency and rate limits,
+        accumulating chunks as they arrive instead of waiting for the full body.
+        
+        Returns:
+            (full response text, last chunk) - the last chunk carries usage metadata
+        """
+        async for attempt in _retrying():
+            with attempt:
+                await self._limiter.acquire()
+                async with self._sem:
+                    stream = await self.model.generate_content_async(
+                        prompt, stream=True, **kwargs
+                    )
+                    parts = []
+                    last_chunk = None
+                    async for chunk in stream:
+                        try:
+                            parts.append(chunk.text)
+                        except ValueError:
+                            # Final chunk may only carry finish reason / usage metadata
+                            pass
+                        last_chunk = chunk
+                    return "".join(parts), last_chunk
+    
+    @staticmethod
+    def prefetch_profiles(user_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Fetch signature profiles for several users in one query.
+        
+        Results also warm the profile cache, so later `get_signature` calls
+        for these users skip the per-user lookup.
+        
+        Args:
+            user_ids: Profile (user) IDs
+        
+        Returns:
+            Dict mapping user_id to profile row (missing users are omitted)
+        """
+        unique_ids = list(dict.fromkeys(uid for uid in user_ids if uid))
+        if not unique_ids:
+            return {}
+        
+        supabase = get_supabase_client()
+        response = supabase.table('profiles').select(
+            f'id, {_PROFILE_COLS}', count=None
+        ).in_('id', unique_ids).execute()
+        
+        profiles = {row['id']: row for row in (response.data or [])}
+        
+        with _signature_cache_lock:
+            for user_id, profile in profiles.items():
+                _profile_cache[user_id] = profile
+        return profiles
+    
+    @staticmethod
+    def get_signature(user_id: str, profile: Optional[Dict] = None) -> str:
+        """
+        Get the rendered HTML signature for a user (TTL-cached).
+        
+        Args:
+            user_id: Profile (user) ID
+            profile: Optional already-fetched profile row; skips the Supabase lookup
+        
+        Returns:
+            Signature HTML, or "" if the profile is missing or incomplete
+        """
+        if profile is None:
+            profile = _fetch_profile_for_signature(user_id)
+        return _render_signature(profile, user_id) if profile else ""
     
-    def generate_single_email(
+    @staticmethod
+    def invalidate_signature(user_id: str) -> None:
+        """Drop all cached signatures rendered for a user."""
+        with _signature_cache_lock:
+            for key in [k for k in _signature_cache if k[0] == user_id]:
+                _signature_cache.pop(key, None)
+    
+    @staticmethod
+    def invalidate_profile(user_id: str) -> None:
+        """Drop cached profile and signatures for a user (call after profile updates)."""
+        with _signature_cache_lock:
+            _profile_cache.pop(user_id, None)
+        EmailGenerator.invalidate_signature(user_id)
+    
+    # Sampling settings shared by all campaign email generations. JSON mode
+    # with a response schema makes Gemini emit a bare {subject, body} object.
+    GENERATION_CONFIG = {
+        "temperature": 0.7,
+        "top_p": 0.95,
+        "max_output_tokens": EMAIL_MAX_OUTPUT_TOKENS,
+        "candidate_count": 1,
+        "response_mime_type": "application/json",
+        "response_schema": EMAIL_SCHEMA,
+    }
+    
+    # Strict JSON array output for multi-category generation
+    MULTI_EMAIL_SCHEMA = {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "category": {"type": "STRING"},
+                "subject": {"type": "STRING"},
+                "body": {"type": "STRING"},
+            },
+            "required": ["category", "subject", "body"],
+        },
+    }
+    
+    async def generate_single_email_async(
         self,
         category_prompt: str,
         campaign_context: Dict[str, str],
         user_id: str = None
     ) -> Dict:
         """
-        Generate a single email for a specific category using Vertex AI Gemini.
+        Generate a single email for a specific category using Vertex AI Gemini
+        (`generate_content_async`), so several emails can run concurrently.
         
         Args:
             category_prompt: The prompt for this email category
             campaign_context: Dictionary with campaign_name, tone, objective, target_city
+            user_id: Sending user (unused; signatures are added when emails are sent)
         
         Returns:
             Dictionary with 'subject', 'body' keys and 'metadata' with token usage
         """
-        prompt = build_single_email_prompt(category_prompt, campaign_context)
-        
-        # Debug logging
-        logger.info(f"CATEGORY: {category_prompt}")
-        logger.info(f"AGENT NAME: {campaign_context.get('agent_name')}")
-        logger.info(f"COMPANY NAME: {campaign_context.get('company_name')}")
-        logger.info(f"TONE: {campaign_context.get('tones')}")
-        logger.info(f"OBJECTIVE: {campaign_context.get('objective')}")
+        prompt = self._prepare_single_email_prompt(category_prompt, campaign_context)
         
         try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.7,
-                    "top_p": 0.95,
-                }
+            text, last_chunk = await self._stream_text_async(
+                prompt, generation_config=self._generation_config
             )
-            
-            parsed = self._parse_email_response(response.text)
-            
-            # Extract token usage metadata
-            token_info = self._extract_token_usage(response)
-            logger.info(
-                f"✅ Generated email | Tokens: {token_info.get('total_tokens', 'N/A')} | "
-                f"Input: {token_info.get('input_tokens')} | Output: {token_info.get('output_tokens')}"
-            )
-            
-            # Add metadata to response
-            parsed['metadata'] = token_info
-            
-            return parsed
+            await _persist_response("campaign", prompt, text)
+            result = self._build_single_email_result(last_chunk, text)
             
         except Exception as e:
             logger.error(f"❌ Error generating email: {str(e)}")
             raise
+        
+        return result
+    
+    async def generate_batch(
+        self,
+        items: List[Tuple[str, Dict[str, str]]],
+        user_id: str = None
+    ) -> List:
+        """
+        Generate several emails concurrently.
+        
+        Args:
+            items: List of (category_prompt, campaign_context) pairs
+            user_id: Sending user (unused; signatures are added when emails are sent)
+        
+        Returns:
+            List aligned with `items`; each entry is the generated email dict
+            or the exception raised for that item
+        """
+        return await asyncio.gather(
+            *(
+                self.generate_single_email_async(category_prompt, campaign_context, user_id)
+                for category_prompt, campaign_context in items
+            ),
+            return_exceptions=True
+        )
+    
+    async def generate_category_emails(
+        self,
+        category_prompts: List[str],
+        campaign_context: Dict[str, str]
+    ) -> List[Dict]:
+        """
+        Generate emails for several categories in a single Gemini request.
+        
+        The shared campaign context is sent once and Gemini returns a
+        schema-constrained JSON array, so K categories cost one round-trip
+        instead of K.
+        
+        Args:
+            category_prompts: Prompts for each email category, in order
+            campaign_context: Dictionary with campaign_name, tone, objective, target_city
+        
+        Returns:
+            List of email dicts aligned with `category_prompts`, each with
+            'subject', 'body' and 'metadata' (token usage split evenly)
+        
+        Raises:
+            ValueError: If the response is not an array of the expected length
+        """
+        if not category_prompts:
+            return []
+        
+        prompt = build_multi_email_prompt(category_prompts, campaign_context)
+        
+        text, last_chunk = await self._stream_text_async(
+            prompt,
+            generation_config=GenerationConfig(
+                **{
+                    **self.GENERATION_CONFIG,
+                    "max_output_tokens": EMAIL_MAX_OUTPUT_TOKENS * len(category_prompts),
+                    "response_schema": self.MULTI_EMAIL_SCHEMA,
+                }
+            )
+        )
+        await _persist_response("campaign_batch", prompt, text)
+        
+        emails = self._parse_email_batch_response(text, len(category_prompts))
+        
+        token_info = self._extract_token_usage(last_chunk, text)
+        per_email = {key: value // len(emails) for key, value in token_info.items()}
+        per_email["batched"] = len(emails)
+        logger.info(
+            "✅ Generated %d emails in one request | Tokens: %s",
+            len(emails), token_info.get('total_tokens', 'N/A')
+        )
+        
+        for email in emails:
+            email['metadata'] = dict(per_email)
+        return emails
+    
+    def _prepare_single_email_prompt(
+        self,
+        category_prompt: str,
+        campaign_context: Dict[str, str]
+    ) -> str:
+        """Build the campaign email prompt and log the generation inputs."""
+        prompt = build_single_email_prompt(category_prompt, campaign_context)
+        
+        # One lazily formatted debug record instead of one per field: under
+        # batch fan-out each record is another acquisition of the logging lock
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "email ctx: cat=%s agent=%s company=%s tone=%s obj=%s",
+                category_prompt,
+                campaign_context.get('agent_name'),
+                campaign_context.get('company_name'),
+                campaign_context.get('tones'),
+                campaign_context.get('objective'),
+            )
+        
+        return prompt
+    
+    def _build_single_email_result(self, response, text: Optional[str] = None) -> Dict:
+        """
+        Parse a Gemini response into the email dict with token metadata.
+        For streamed responses pass the accumulated `text` and the last chunk.
+        """
+        if text is None:
+            text = response.text
+        parsed = self._parse_email_response(text)
+        
+        # Extract token usage metadata
+        token_info = self._extract_token_usage(response, text)
+        logger.info(
+            "✅ Generated email | Tokens: %s | Input: %s | Output: %s",
+            token_info.get('total_tokens', 'N/A'),
+            token_info.get('input_tokens'),
+            token_info.get('output_tokens'),
+        )
+        
+        # Add metadata to response
+        parsed['metadata'] = token_info
+        
+        return parsed
     
     async def generate_triggered_email(
         self,
@@ -98,7 +715,8 @@ class EmailGenerator:
         markets: list,
         purpose: str,
         persona: str,
-        short_description: str = None
+        short_description: str = None,
+        profile: Optional[Dict] = None
     ) -> Dict[str, str]:
         """
         Generate personalized email content for triggered emails.
@@ -110,32 +728,30 @@ class EmailGenerator:
             purpose: Purpose of the email
             persona: Target persona (buyer, seller, investor, past_client, referral, cold_prospect)
             short_description: Optional additional context
+            profile: Optional prefetched profile row used for the signature
         
         Returns:
             Dictionary with 'subject' and 'body' keys
         """
         try:
             logger.info(
-                f"🎯 Generating triggered email for {realtor_name} - "
-                f"Purpose: {purpose} - Persona: {persona}"
-                f"Short Desc: {short_description}"
+                "🎯 Generating triggered email for %s - Purpose: %s - Persona: %s - Short Desc: %s",
+                realtor_name, purpose, persona, short_description
             )
             
             prompt = build_triggered_email_prompt(
                 realtor_name, brokerage, markets, purpose, persona, short_description
             )
             
-            # Generate content
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            logger.info(f"📧 Generated email content for purpose: {purpose}")
-            
-            # Clean and parse JSON response
-            clean_response = response_text.replace("```json", "").replace("```", "").strip()
+            # Stream content
+            response_text, _ = await self._stream_text_async(
+                prompt, generation_config=TRIGGERED_GENERATION_CONFIG
+            )
+            response_text = response_text.strip()
+            await _persist_response("triggered", prompt, response_text)
             
             try:
-                email_content = json.loads(clean_response)
+                email_content = _loads_llm_json(response_text)
                 
                 # Validate required fields
                 if not email_content.get('subject') or not email_content.get('body'):
@@ -152,71 +768,28 @@ class EmailGenerator:
                 # Append signature if user_id provided
                 if user_id:
                     try:
-                        supabase = get_supabase_client()
-                        profile_response = supabase.table('profiles').select(
-                            'phone, email, calendly_link, full_name, years_in_business, '
-                            'brokerage_logo_url, brand_logo_url, realtor_type, '
-                            'company_name, brokerage_name, markets'
-                        ).eq('id', user_id).single().execute()
-                        
-                        if profile_response.data:
-                            phone = profile_response.data.get('phone', '')
-                            email_addr = profile_response.data.get('email', '')
-                            calendly_link = profile_response.data.get('calendly_link', '')
-                            full_name = profile_response.data.get('full_name', '')
-                            years = profile_response.data.get('years_in_business', 0)
-                            realtor_type = profile_response.data.get('realtor_type', '').lower()
-                            company_name = profile_response.data.get('company_name', '')
-                            brokerage_name = profile_response.data.get('brokerage_name', '')
-                            markets = profile_response.data.get('markets', [])
-                            
-                            # Logo selection based on realtor type
-                            if realtor_type == 'team':
-                                logo_url = profile_response.data.get('brand_logo_url', '')
-                            else:
-                                logo_url = profile_response.data.get('brokerage_logo_url', '')
-                            
-                            # Display brokerage priority
-                            display_brokerage = brokerage_name if brokerage_name else company_name
-                            
-                            if full_name and phone and email_addr:
-                                experience = f"{years}+ years helping clients achieve their real estate goals" if years else None
-                                markets_list = markets if isinstance(markets, list) else []
-                                
-                                signature = build_email_signature(
-                                    realtor_name=full_name,
-                                    brokerage=display_brokerage,
-                                    phone=phone,
-                                    email=email_addr,
-                                    title="Real Estate Professional",
-                                    experience=experience,
-                                    markets=markets_list,
-                                    calendly_link=calendly_link if calendly_link else None,
-                                    logo_url=logo_url if logo_url else None
-                                )
-                                
-                                email_content['body'] = email_content['body'] + signature
-                                logger.info("✅ Appended email signature")
+                        signature = self.get_signature(user_id, profile)
+                        if signature:
+                            email_content['body'] = email_content['body'] + signature
+                            logger.debug("Appended email signature")
                     except Exception as sig_error:
                         logger.warning(f"Could not append signature: {sig_error}")
                 
                 return email_content
                 
-            except json.JSONDecodeError as e:
+            except ValueError as e:
                 logger.error(f"Failed to parse email JSON: {e}")
-                logger.error(f"Raw response: {clean_response}")
+                logger.error(f"Raw response: {response_text}")
                 
                 # Fallback response
                 markets_str = ", ".join(markets) if markets else "local area"
                 return {
                     "subject": f"Important Update from {realtor_name}",
-                    "body": (
-                        f"<p>Dear {{name}},</p>"
-                        f"<p>I hope this message finds you well. I wanted to reach out regarding {purpose.lower()}.</p>"
-                        f"<p>As your trusted real estate professional at {brokerage}, "
-                        f"I'm committed to keeping you informed about important developments in the {markets_str} market.</p>"
-                        f"<p>Please don't hesitate to reach out if you have any questions.</p>"
-                        f"<p>Best regards,<br/>{realtor_name}</p>"
+                    "body": _PARSE_FALLBACK_BODY.safe_substitute(
+                        purpose=purpose.lower(),
+                        brokerage=brokerage,
+                        markets=markets_str,
+                        realtor=realtor_name,
                     )
                 }
                 
@@ -225,15 +798,13 @@ class EmailGenerator:
             # Return fallback email
             return {
                 "subject": f"Update from {realtor_name}",
-                "body": (
-                    f"<p>Dear {{name}},</p>"
-                    f"<p>I hope you're doing well. I wanted to share some important information with you.</p>"
-                    f"<p>Thank you for your continued trust in my services.</p>"
-                    f"<p>Best regards,<br/>{realtor_name}<br/>{brokerage}</p>"
+                "body": _ERROR_FALLBACK_BODY.safe_substitute(
+                    realtor=realtor_name,
+                    brokerage=brokerage,
                 )
             }
     
-    def process_image_to_contacts(self, image_bytes: bytes) -> pd.DataFrame:
+    async def process_image_to_contacts(self, image_bytes: bytes) -> List[Dict]:
         """
         Process an image using Google Vision API to extract text,
         then use Gemini to structure the data into contact information.
@@ -242,61 +813,110 @@ class EmailGenerator:
             image_bytes: Raw image bytes (JPG, PNG, etc.)
             
         Returns:
-            DataFrame with columns: name, email, phone, city, address
+            Contact dicts with keys: name, email, phone, city, address
         """
-        if not self.vision_client:
-            raise ValueError("Vision client not initialized")
-        
         try:
-            # Step 1: Extract text using Vision API
-            img = vision.Image(content=image_bytes)
-            response = self.vision_client.text_detection(image=img)
-            
-            if response.error.message:
-                raise Exception(f"Vision API error: {response.error.message}")
-            
-            if not response.text_annotations:
-                logger.warning("No text detected in image")
-                return pd.DataFrame(columns=["name", "email", "phone", "city", "address"])
-            
-            extracted_text = response.text_annotations[0].description
-            logger.info("✅ Vision API extracted text from image")
-            
-            # Step 2: Structure the data using Gemini
-            prompt = build_image_extraction_prompt(extracted_text)
-            output = self.model.generate_content(prompt).text
-            logger.info("✅ Gemini structured the contact data")
-            
-            # Clean and parse JSON
-            clean_json = output.replace("```json", "").replace("```", "").strip()
-            data = json.loads(clean_json)
-            
-            # Convert to DataFrame
-            if isinstance(data, dict):
-                data = [data]
-            
-            df = pd.DataFrame(data)
-            
-            # Ensure all required columns exist
-            required_columns = ["name", "email", "phone", "city", "address"]
-            for col in required_columns:
-                if col not in df.columns:
-                    df[col] = None
-            
-            df = df[required_columns]
-            logger.info(f"✅ Extracted {len(df)} contacts from image")
-            
-            return df
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse Gemini output as JSON: {e}")
-            logger.error(f"Raw output: {output if 'output' in locals() else 'N/A'}")
-            raise Exception("Failed to structure contact data. Please try a clearer image.")
+            results = await self.process_images_to_contacts([image_bytes])
+            return results[0]
         except Exception as e:
             logger.error(f"Error processing image: {e}")
             raise
     
-    def _parse_email_response(self, response_text: str) -> Dict[str, str]:
+    async def process_images_to_contacts(self, images: List[bytes]) -> List[List[Dict]]:
+        """
+        Extract contacts from several images.
+        
+        Text detection runs through the async Vision client in
+        `batch_annotate_images` calls of up to 16 images, then Gemini
+        structures the texts in concurrent multi-page requests (falling back
+        to one request per page if a batched response doesn't line up).
+        
+        Args:
+            images: Raw image bytes for each upload
+        
+        Returns:
+            List of contact lists aligned with `images`
+        """
+        if self.vision_client is None:
+            # Created lazily so the gRPC channel binds to the running event loop.
+            # Keepalive pings keep the long-lived channel usable across idle periods.
+            transport_cls = vision.ImageAnnotatorAsyncClient.get_transport_class("grpc_asyncio")
+            channel = transport_cls.create_channel(
+                credentials=self._credentials,
+                options=GRPC_KEEPALIVE_OPTIONS,
+            )
+            self.vision_client = vision.ImageAnnotatorAsyncClient(
+                transport=transport_cls(channel=channel)
+            )
+        
+        # Decoding/resizing is CPU-bound, so keep it off the event loop
+        images = await asyncio.gather(
+            *(asyncio.to_thread(_preprocess_for_ocr, b) for b in images)
+        )
+        
+        feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+        texts: List[Optional[str]] = []
+        
+        for start in range(0, len(images), VISION_BATCH_SIZE):
+            chunk = images[start:start + VISION_BATCH_SIZE]
+            requests = [
+                vision.AnnotateImageRequest(image=vision.Image(content=b), features=[feature])
+                for b in chunk
+            ]
+            async for attempt in _retrying():
+                with attempt:
+                    response = await self.vision_client.batch_annotate_images(requests=requests)
+            for image_response in response.responses:
+                if image_response.error.message:
+                    raise Exception(f"Vision API error: {image_response.error.message}")
+                if not image_response.text_annotations:
+                    logger.warning("No text detected in image")
+                texts.append(
+                    image_response.text_annotations[0].description
+                    if image_response.text_annotations else None
+                )
+        
+        logger.info(f"✅ Vision API extracted text from {sum(1 for t in texts if t)}/{len(images)} images")
+        
+        async def structure_page(text: str) -> List[Dict]:
+            response = await self._generate_content_async(
+                build_image_extraction_prompt(text), generation_config=CONTACTS_GENERATION_CONFIG
+            )
+            try:
+                return _extract_contact_rows(_loads_llm_json(response.text))
+            except ValueError as e:
+                logger.error(f"Failed to parse Gemini output as JSON: {e}")
+                raise Exception("Failed to structure contact data. Please try a clearer image.")
+        
+        async def structure(pages: List[str]) -> List[List[Dict]]:
+            if len(pages) > 1:
+                response = await self._generate_content_async(
+                    build_image_extraction_prompt_batch(pages),
+                    generation_config=CONTACTS_BATCH_GENERATION_CONFIG
+                )
+                try:
+                    parsed = _loads_llm_json(response.text)
+                except ValueError:
+                    parsed = None
+                per_page = parsed.get("pages") if isinstance(parsed, dict) else None
+                if isinstance(per_page, list) and len(per_page) == len(pages):
+                    return [_extract_contact_rows(page) if page else [] for page in per_page]
+                logger.warning(f"⚠️ Batched contact extraction didn't return {len(pages)} pages, retrying per page")
+            return await asyncio.gather(*(structure_page(text) for text in pages))
+        
+        groups = _group_pages(texts)
+        structured = await asyncio.gather(*(structure([texts[i] for i in group]) for group in groups))
+        
+        results: List[List[Dict]] = [[] for _ in texts]
+        for group, contacts in zip(groups, structured):
+            for index, page_contacts in zip(group, contacts):
+                results[index] = page_contacts
+        
+        logger.info(f"✅ Extracted {sum(len(c) for c in results)} contacts from {len(images)} images")
+        return results
+    
+    @staticmethod
+    def _parse_email_response(response_text: str) -> Dict[str, str]:
         """
         Parse Gemini response to extract subject and body.
         
@@ -306,30 +926,14 @@ class EmailGenerator:
         Returns:
             Dictionary with 'subject' and 'body' keys
         """
+        # Fast path for the expected {"subject", "body"} shape
+        fast = parse_subject_body(_strip_fence(response_text))
+        if fast is not None:
+            subject, body = fast
+            return {"subject": subject.strip(), "body": body.strip()}
+        
         try:
-            # Clean up response text
-            response_text = response_text.strip()
-            
-            # Extract JSON from markdown code blocks if present
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-            
-            # Try to fix common JSON issues
-            if response_text.count('"') % 2 != 0:
-                response_text = response_text + '"'
-            
-            # Remove any trailing incomplete JSON structures
-            if not response_text.endswith('}'):
-                last_brace = response_text.rfind('}')
-                if last_brace > 0:
-                    response_text = response_text[:last_brace + 1]
-                else:
-                    raise ValueError("No closing brace found in response")
-            
-            # Parse JSON
-            data = json.loads(response_text)
+            data = _loads_llm_json(response_text)
             
             # Validate required fields
             if "subject" not in data or "body" not in data:
@@ -340,17 +944,48 @@ class EmailGenerator:
                 "body": str(data["body"]).strip()
             }
             
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             logger.error(f"❌ Failed to parse JSON: {str(e)}")
             logger.error(f"Response: {response_text[:500]}")
             raise ValueError(f"Invalid JSON response: {str(e)}")
     
-    def _extract_token_usage(self, response) -> Dict:
+    @staticmethod
+    def _parse_email_batch_response(response_text: str, expected: int) -> List[Dict[str, str]]:
+        """
+        Parse a multi-category Gemini response into subject/body dicts.
+        
+        Args:
+            response_text: Raw text response from Gemini (JSON array)
+            expected: Number of emails requested
+        
+        Returns:
+            List of dictionaries with 'subject' and 'body' keys
+        """
+        data = _loads_llm_json(response_text)
+        
+        if not isinstance(data, list) or len(data) != expected:
+            raise ValueError(
+                f"Expected a JSON array of {expected} emails, got "
+                f"{len(data) if isinstance(data, list) else type(data).__name__}"
+            )
+        
+        emails = []
+        for item in data:
+            if not isinstance(item, dict) or "subject" not in item or "body" not in item:
+                raise ValueError("Batch response item missing 'subject' or 'body'")
+            emails.append({
+                "subject": str(item["subject"]).strip(),
+                "body": str(item["body"]).strip()
+            })
+        return emails
+    
+    def _extract_token_usage(self, response, text: Optional[str] = None) -> Dict:
         """
         Extract token usage from Gemini response.
         
         Args:
-            response: Gemini response object
+            response: Gemini response object (or last streamed chunk)
+            text: Full response text, used for the estimate when streaming
         
         Returns:
             Dictionary with input_tokens, output_tokens, total_tokens
@@ -363,8 +998,8 @@ class EmailGenerator:
                 output_tokens = getattr(usage_metadata, 'candidates_token_count', 0)
                 total_tokens = input_tokens + output_tokens
             else:
-                # Estimate based on response length
-                total_tokens = len(response.text) // 4
+                # Rough estimate (~4 characters per token) from the response text
+                total_tokens = len(text if text is not None else response.text) // 4
                 input_tokens = 0
                 output_tokens = total_tokens
             
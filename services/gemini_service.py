@@ -5,8 +5,8 @@ Delegates email generation to email_generation.py for better organization.
 
 import os
 import logging
-from typing import Dict, Optional
-import pandas as pd
+import threading
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 # Lazy imports for memory optimization
@@ -35,9 +35,129 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# Create directory for storing responses (for debugging)
-GEMINI_RESPONSES_DIR = os.path.join(os.path.dirname(__file__), "..", "gemini_responses")
-os.makedirs(GEMINI_RESPONSES_DIR, exist_ok=True)
+
+# Text model used for all email generation
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+
+# Vertex AI models, the Vision client and the EmailGenerator are shared by every
+# GeminiService instance, so credential setup and gRPC channel creation run once
+# per process instead of once per service object.
+_clients_lock = threading.Lock()
+_shared_clients: Optional[Dict] = None
+
+
+def _configure_google_credentials():
+    """
+    Resolve Google credentials.
+    
+    Returns:
+        In-memory service account credentials built from GOOGLE_CREDENTIALS_JSON,
+        or None to let the SDKs use GOOGLE_APPLICATION_CREDENTIALS / ADC
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("🔍 Google credential env: %s", {
+            "cwd": os.getcwd(),
+            "GOOGLE_CREDENTIALS_JSON": bool(os.getenv("GOOGLE_CREDENTIALS_JSON")),
+            "GOOGLE_APPLICATION_CREDENTIALS": bool(os.getenv("GOOGLE_APPLICATION_CREDENTIALS")),
+            "PROJECT_ID": bool(os.getenv("PROJECT_ID")),
+        })
+    
+    # Handle Google credentials - prioritize JSON for production, file for local
+    google_creds_json = os.getenv("GOOGLE_CREDENTIALS_JSON")
+    if google_creds_json:
+        # Production deployment with JSON credentials, kept in memory
+        import json
+        from google.oauth2 import service_account
+        try:
+            info = json.loads(google_creds_json)
+        except json.JSONDecodeError:
+            logger.error("❌ Invalid JSON format in GOOGLE_CREDENTIALS_JSON")
+            raise ValueError("Invalid Google credentials JSON format")
+        credentials = service_account.Credentials.from_service_account_info(
+            info, scopes=["https://www.googleapis.com/auth/cloud-platform"]
+        )
+        logger.info("✅ Loaded Google credentials from GOOGLE_CREDENTIALS_JSON environment variable")
+        return credentials
+    elif os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
+        # Use existing file path (local development)
+        creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        if os.path.exists(creds_path):
+            logger.info(f"✅ Using Google credentials from file: {creds_path}")
+        else:
+            logger.error(f"❌ Google credentials file not found at: {creds_path}")
+    else:
+        # Fallback to local file for development
+        creds_path = os.path.join(os.path.dirname(__file__), "..", "creds", "realtygenie-55126509a168.json")
+        if os.path.exists(creds_path):
+            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = creds_path
+            logger.info(f"✅ Set Google credentials from local file: {creds_path}")
+        else:
+            logger.warning("⚠️ Google credentials not found - some features may not work")
+    
+    return None
+
+
+def _create_shared_clients() -> Dict:
+    """Initialize Vertex AI and build the process-wide model and Vision clients."""
+    logger.info("🔧 Initializing Gemini Service with lazy loading...")
+    
+    clients = {
+        "model": None, "image_model": None, "vision_client": None,
+        "email_generator": None,
+    }
+    
+    # Lazy load dependencies
+    vertexai, GenerativeModel = get_vertexai()
+    vision = get_google_vision()
+    
+    if not vertexai or not GenerativeModel:
+        logger.warning("⚠️ VertexAI not available - AI features disabled")
+        return clients
+    
+    credentials = _configure_google_credentials()
+    
+    # Initialize Vertex AI
+    project_id = os.getenv("PROJECT_ID")
+    location = os.getenv("LOCATION")
+    
+    if not project_id:
+        raise ValueError("❌ PROJECT_ID not found")
+    
+    # gRPC transport serves both sync and async calls without the
+    # REST async-credentials fallback
+    vertexai.init(
+        project=project_id, location=location, credentials=credentials, api_transport="grpc"
+    )
+    
+    # Initialize Gemini model
+    clients["model"] = GenerativeModel(GEMINI_MODEL_NAME)
+    clients["image_model"] = GenerativeModel("gemini-2.5-flash-image")
+    
+    # The Vision async client is created by EmailGenerator on first use, inside
+    # the running event loop its gRPC channel must bind to
+    if not vision:
+        logger.warning("⚠️ Google Vision not available - image processing disabled")
+    
+    # Initialize email generator with model and vision client
+    EmailGenerator = get_email_generator()
+    clients["email_generator"] = EmailGenerator(
+        clients["model"], clients["vision_client"], credentials=credentials
+    )
+    
+    logger.info("✅ Vertex AI Gemini and Vision API initialized successfully")
+    return clients
+
+
+def _get_shared_clients() -> Dict:
+    """Return the process-wide clients, creating them on first use."""
+    global _shared_clients
+    
+    if _shared_clients is None:
+        with _clients_lock:
+            if _shared_clients is None:
+                _shared_clients = _create_shared_clients()
+    
+    return _shared_clients
 
 
 class GeminiService:
@@ -50,102 +170,29 @@ class GeminiService:
     def __init__(self):
         """Initialize service with lazy loading for memory efficiency."""
         self.model = None
+        self.image_model = None
         self.vision_client = None
         self.email_generator = None
         self._initialized = False
-        self._vertexai = None
-        self._GenerativeModel = None
-        self._vision = None
         
     def _ensure_initialized(self):
-        """Ensure the service is initialized with Google APIs."""
+        """Ensure the service is bound to the shared Google API clients."""
         if self._initialized:
             return
             
         try:
-            logger.info("🔧 Initializing Gemini Service with lazy loading...")
-            
-            # Lazy load dependencies
-            self._vertexai, self._GenerativeModel = get_vertexai()
-            self._vision = get_google_vision()
-            
-            if not self._vertexai or not self._GenerativeModel:
-                logger.warning("⚠️ VertexAI not available - AI features disabled")
-                self._initialized = True
-                return
-                
-            logger.info(f"📍 Current working directory: {os.getcwd()}")
-            logger.info(f"🔍 Checking environment variables...")
-            logger.info(f"   - GOOGLE_CREDENTIALS_JSON: {'✅ Found' if os.getenv('GOOGLE_CREDENTIALS_JSON') else '❌ Not found'}")
-            logger.info(f"   - GOOGLE_APPLICATION_CREDENTIALS: {'✅ Found' if os.getenv('GOOGLE_APPLICATION_CREDENTIALS') else '❌ Not found'}")
-            logger.info(f"   - PROJECT_ID: {'✅ Found' if os.getenv('PROJECT_ID') else '❌ Not found'}")
-            
-            # Handle Google credentials - prioritize JSON for production, file for local
-            google_creds_json = os.getenv("GOOGLE_CREDENTIALS_JSON")
-            if google_creds_json:
-                # Production deployment with JSON credentials
-                import tempfile
-                import json
-                try:
-                    # Validate JSON format
-                    json.loads(google_creds_json)
-                    # Create temporary file with credentials
-                    temp_creds = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json')
-                    temp_creds.write(google_creds_json)
-                    temp_creds.close()
-                    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = temp_creds.name
-                    logger.info("✅ Set Google credentials from GOOGLE_CREDENTIALS_JSON environment variable")
-                except json.JSONDecodeError:
-                    logger.error("❌ Invalid JSON format in GOOGLE_CREDENTIALS_JSON")
-                    raise ValueError("Invalid Google credentials JSON format")
-            elif os.getenv("GOOGLE_APPLICATION_CREDENTIALS"):
-                # Use existing file path (local development)
-                creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-                if os.path.exists(creds_path):
-                    logger.info(f"✅ Using Google credentials from file: {creds_path}")
-                else:
-                    logger.error(f"❌ Google credentials file not found at: {creds_path}")
-            else:
-                # Fallback to local file for development
-                creds_path = os.path.join(os.path.dirname(__file__), "..", "creds", "realtygenie-55126509a168.json")
-                if os.path.exists(creds_path):
-                    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = creds_path
-                    logger.info(f"✅ Set Google credentials from local file: {creds_path}")
-                else:
-                    logger.warning("⚠️ Google credentials not found - some features may not work")
-            
-            # Initialize Vertex AI
-            project_id = os.getenv("PROJECT_ID")
-            location = os.getenv("LOCATION")
-            
-            if not project_id:
-                raise ValueError("❌ PROJECT_ID not found")
-            
-            self._vertexai.init(project=project_id, location=location)
-            
-            # Initialize Gemini model
-            self.model = self._GenerativeModel("gemini-2.5-flash")
-            self.image_model = self._GenerativeModel("gemini-2.5-flash-image")
-            
-            # Initialize Vision API client (only if available)
-            if self._vision:
-                self.vision_client = self._vision.ImageAnnotatorClient()
-            else:
-                self.vision_client = None
-                logger.warning("⚠️ Google Vision not available - image processing disabled")
-            
-            # Initialize email generator with model and vision client
-            EmailGenerator = get_email_generator()
-            self.email_generator = EmailGenerator(self.model, self.vision_client)
-            
-            self._initialized = True
-            logger.info("✅ Vertex AI Gemini and Vision API initialized successfully")
-            
+            clients = _get_shared_clients()
         except Exception as e:
             logger.error(f"❌ Failed to initialize Gemini service: {str(e)}")
             raise ValueError(f"Gemini initialization failed: {str(e)}")
+        
+        self.model = clients["model"]
+        self.image_model = clients["image_model"]
+        self.vision_client = clients["vision_client"]
+        self.email_generator = clients["email_generator"]
+        self._initialized = True
     
-    def generate_single_email(
+    async def generate_single_email(
         self,
         category_prompt: str,
         campaign_context: Dict[str, str],
@@ -157,15 +204,54 @@ class GeminiService:
         Args:
             category_prompt: The prompt for this email category
             campaign_context: Dictionary with campaign_name, tone, objective, target_city
-            user_id: Optional user ID for signature appending
+            user_id: Sending user (unused; signatures are added when emails are sent)
         
         Returns:
             Dictionary with 'subject', 'body' keys and 'metadata' with token usage
         """
         self._ensure_initialized()
-        return self.email_generator.generate_single_email(category_prompt, campaign_context, user_id)
+        return await self.email_generator.generate_single_email_async(
+            category_prompt, campaign_context, user_id
+        )
+    
+    async def generate_emails_batch(
+        self,
+        items: List[Tuple[str, Dict[str, str]]],
+        user_id: str = None
+    ) -> List:
+        """
+        Generate several emails concurrently using Vertex AI Gemini.
+        
+        Args:
+            items: List of (category_prompt, campaign_context) pairs
+            user_id: Sending user (unused; signatures are added when emails are sent)
+        
+        Returns:
+            List aligned with `items`; each entry is the generated email dict
+            or the exception raised for that item
+        """
+        self._ensure_initialized()
+        return await self.email_generator.generate_batch(items, user_id)
+    
+    async def generate_category_emails(
+        self,
+        category_prompts: List[str],
+        campaign_context: Dict[str, str]
+    ) -> List[Dict]:
+        """
+        Generate emails for several categories in one Vertex AI Gemini request.
+        
+        Args:
+            category_prompts: Prompts for each email category, in order
+            campaign_context: Dictionary with campaign_name, tone, objective, target_city
+        
+        Returns:
+            List of email dicts aligned with `category_prompts`
+        """
+        self._ensure_initialized()
+        return await self.email_generator.generate_category_emails(category_prompts, campaign_context)
     
-    def process_image(self, image_bytes: bytes) -> pd.DataFrame:
+    async def process_image(self, image_bytes: bytes) -> List[Dict]:
         """
         Process an image using Google Vision API to extract text,
         then use Gemini to structure the data into contact information.
@@ -174,10 +260,10 @@ class GeminiService:
             image_bytes: Raw image bytes (JPG, PNG, etc.)
             
         Returns:
-            DataFrame with columns: name, email, phone, city, address
+            Contact dicts with keys: name, email, phone, city, address
         """
         self._ensure_initialized()
-        return self.email_generator.process_image_to_contacts(image_bytes)
+        return await self.email_generator.process_image_to_contacts(image_bytes)
 
     async def generate_triggered_email(
         self,
@@ -187,7 +273,8 @@ class GeminiService:
         markets: list,
         purpose: str,
         persona: str,
-        short_description: str = None
+        short_description: str = None,
+        profile: Optional[Dict] = None
     ) -> Dict[str, str]:
         """
         Generate personalized email content for triggered emails.
@@ -199,13 +286,15 @@ class GeminiService:
             purpose: Purpose of the email
             persona: Target persona (buyer, seller, investor, past_client, referral, cold_prospect)
             short_description: Optional additional context
+            profile: Optional prefetched profile row used for the signature
         
         Returns:
             Dictionary with 'subject' and 'body' keys
         """
         self._ensure_initialized()
         return await self.email_generator.generate_triggered_email(
-            user_id, realtor_name, brokerage, markets, purpose, persona, short_description
+            user_id, realtor_name, brokerage, markets, purpose, persona, short_description,
+            profile=profile
         )
 
 
@@ -216,11 +305,13 @@ def get_gemini_service() -> GeminiService:
     global _gemini_service_instance
     
     if _gemini_service_instance is None:
-        try:
-            _gemini_service_instance = GeminiService()
-        except Exception as e:
-            logger.error(f"Failed to initialize Gemini service: {str(e)}")
-            raise
+        with _clients_lock:
+            if _gemini_service_instance is None:
+                try:
+                    _gemini_service_instance = GeminiService()
+                except Exception as e:
+                    logger.error(f"Failed to initialize Gemini service: {str(e)}")
+                    raise
     
     return _gemini_service_instance
 
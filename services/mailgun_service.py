@@ -1,19 +1,85 @@
 import os
+import asyncio
+import functools
 import logging
+import httpx
+import orjson
 import requests
 import re
-from typing import Optional, Dict, List
+import threading
+from email.utils import formataddr
+from typing import ClassVar, Optional, Dict, List
+from urllib.parse import urlencode
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.validation import is_valid_email
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:  # optional C parser; fall back to the tag-stripping regex
+    HTMLParser = None
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-load_dotenv()
+
+_FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+
+def _check_addresses(*addresses: str) -> None:
+    """Reject malformed addresses locally instead of after a Mailgun round-trip"""
+    for address in addresses:
+        if not is_valid_email(address):
+            raise ValueError(f"Invalid email: {address}")
+
+
+def _encode_form(data: Dict) -> bytes:
+    """
+    Form-encode a Mailgun payload in one pass (list values become repeated
+    fields), so the HTTP client sends the bytes as-is instead of re-encoding.
+    """
+    return urlencode(data, doseq=True).encode("ascii")
+
+
+class MailgunAPIError(Exception):
+    """Raised when the Mailgun API returns a non-success status code"""
+    
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def chunk_batch_recipients(recipients: List[Dict], size: int) -> List[List[Dict]]:
+    """
+    Split recipients into send_batch-sized chunks.
+    recipient-variables are keyed by email, so an address already present in
+    the current chunk (e.g. a lead shared by two agents) starts a new chunk.
+    """
+    chunks = []
+    current = []
+    seen = set()
+    for recipient in recipients:
+        if len(current) >= size or recipient["email"] in seen:
+            chunks.append(current)
+            current = []
+            seen = set()
+        current.append(recipient)
+        seen.add(recipient["email"])
+    if current:
+        chunks.append(current)
+    return chunks
 
 
 class MailgunService:
     """Service for sending emails via Mailgun using requests library"""
     
+    # Mailgun accepts at most 1000 recipients per batch send
+    MAX_BATCH_RECIPIENTS = 1000
+    
+    # Tag-stripping fallback for _strip_html when selectolax is missing
+    _TAG_RE: ClassVar[re.Pattern] = re.compile(r'<[^<]+?>')
+    
     def __init__(self):
+        load_dotenv()
         self.api_key = os.getenv("MAILGUN_API_KEY")
         self.domain = os.getenv("MAILGUN_DOMAIN")
         self.sender_email = os.getenv("MAILGUN_SENDER_EMAIL", f"Realty Genie <postmaster@{os.getenv('MAILGUN_DOMAIN', 'rg.realtygenie.co')}>")
@@ -27,8 +93,42 @@ class MailgunService:
         # Auth credentials
         self.auth = ("api", self.api_key)
         
+        # Pooled keep-alive session so sends reuse the TCP/TLS connection instead
+        # of handshaking with Mailgun per message. Only connection failures are
+        # retried: a POST that reached Mailgun is never resent.
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=64,
+            max_retries=Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.2),
+        ))
+        
+        # Static payload fragments merged into every message
+        self._base_payload = {"from": self.sender_email}
+        self._tracking_fields = {
+            "o:tracking": "yes",
+            "o:tracking-clicks": "yes",
+            "o:tracking-opens": "yes",
+        }
+        
+        # HTTP/2 client for async sends, created on first use so it binds to
+        # the running event loop. Concurrent POSTs multiplex on one connection.
+        self._aclient: Optional[httpx.AsyncClient] = None
+        
         logger.info(f"✅ Mailgun service initialized for domain: {self.domain}")
     
+    def warm_up(self) -> None:
+        """
+        Open a pooled connection to Mailgun (DNS + TCP + TLS) ahead of the
+        first send. Best effort: failures are only logged.
+        """
+        try:
+            self.session.head(f"https://api.mailgun.net/v3/{self.domain}", timeout=3)
+            logger.info("🔥 Mailgun connection warmed up")
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"⚠️ Mailgun warm-up failed: {e}")
+    
     def send_email(
         self,
         to_email: str,
@@ -61,87 +161,318 @@ class MailgunService:
             Response dict with message_id and status
         """
         try:
-            if to_name:
-                recipient = f"{to_name} <{to_email}>"
-            else:
-                recipient = to_email
+            data = self._build_message_data(
+                to_email, to_name, subject, html_body, text_body,
+                reply_to, cc, bcc, tags, tracking,
+            )
+            
+            response = self.session.post(
+                self.api_url,
+                data=_encode_form(data),
+                headers=_FORM_HEADERS,
+                timeout=(3.05, 10)
+            )
+            
+            return self._handle_send_response(response, to_email, to_name, subject)
+        
+        except requests.exceptions.Timeout:
+            logger.error(f"❌ Timeout sending email to {to_email}")
+            raise
+        except requests.exceptions.ConnectionError:
+            logger.error(f"❌ Connection error sending email to {to_email}")
+            raise
+        except MailgunAPIError:
+            # Already logged with the response body
+            raise
+        except Exception as e:
+            logger.error(f"❌ Failed to send email to {to_email}: {str(e)}")
+            raise
+    
+    def send_batch(
+        self,
+        recipients: List[Dict],
+        subject: str = "",
+        html_body: str = "",
+        text_body: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        tracking: bool = True,
+    ) -> Dict:
+        """
+        Send one templated email to many recipients in a single API call
+        using Mailgun batch sending (recipient-variables).
+        
+        Each recipient only sees their own address. Per-recipient values are
+        referenced in the subject/body as %recipient.<key>%.
+        
+        Args:
+            recipients: List of dicts with 'email', optional 'name', and any other
+                        per-recipient variables (at most MAX_BATCH_RECIPIENTS)
+            subject: Email subject template
+            html_body: Email body template in HTML format
+            text_body: Plain text body template (optional, auto-generated if not provided)
+            tags: List of tags for tracking (optional)
+            tracking: Enable open/click tracking (default: True)
+        
+        Returns:
+            Response dict with message_id, recipient_count and status
+        """
+        if len(recipients) > self.MAX_BATCH_RECIPIENTS:
+            raise ValueError(f"Mailgun batch sends are limited to {self.MAX_BATCH_RECIPIENTS} recipients")
+        
+        try:
+            to = []
+            recipient_variables = {}
+            for recipient in recipients:
+                email = recipient["email"]
+                if not is_valid_email(email):
+                    # One bad address shouldn't fail the other recipients' send
+                    logger.warning(f"⚠️ Skipping invalid email in batch: {email}")
+                    continue
+                name = recipient.get("name")
+                to.append(formataddr((name, email)) if name else email)
+                recipient_variables[email] = {k: v for k, v in recipient.items() if k != "email"}
+            
+            if not to:
+                raise ValueError("No valid recipients in batch")
             
             if not text_body:
                 text_body = self._strip_html(html_body)
             
             data = {
-                "from": self.sender_email,
-                "to": recipient,
+                **self._base_payload,
+                "to": to,
                 "subject": subject,
                 "html": html_body,
                 "text": text_body,
+                "recipient-variables": orjson.dumps(recipient_variables).decode(),
             }
             
-            if reply_to:
-                data["h:Reply-To"] = reply_to
-            
-            if cc:
-                data["cc"] = ", ".join(cc)
-            
-            if bcc:
-                data["bcc"] = ", ".join(bcc)
-            
             if tags:
                 data["o:tag"] = tags
             
             if tracking:
-                data["o:tracking"] = "yes"
-                data["o:tracking-clicks"] = "yes"
-                data["o:tracking-opens"] = "yes"
+                data.update(self._tracking_fields)
             
-            response = requests.post(
+            response = self.session.post(
                 self.api_url,
-                auth=self.auth,
-                data=data,
-                timeout=10
+                data=_encode_form(data),
+                headers=_FORM_HEADERS,
+                timeout=(3.05, 30)
             )
             
             if response.status_code not in [200, 201]:
                 logger.error(f"❌ Mailgun API error: {response.status_code}")
                 logger.error(f"Response: {response.text}")
-                raise Exception(f"Mailgun API returned {response.status_code}: {response.text}")
+                raise MailgunAPIError(response.status_code, f"Mailgun API returned {response.status_code}: {response.text}")
             
-            result = response.json()
+            result = orjson.loads(response.content)
             message_id = result.get("id", "unknown")
             
-            logger.info(f"Email sent to {to_email}")
-            logger.info(f"Message ID: {message_id}")
-            logger.info(f"Status: {result.get('message', 'Queued')}")
+            logger.info("Batch email sent to %d recipients (id=%s)", len(to), message_id)
             
             return {
                 "success": True,
                 "message_id": message_id,
-                "to_email": to_email,
-                "to_name": to_name,
+                "recipient_count": len(to),
                 "subject": subject,
                 "status": "sent",
                 "timestamp": result.get("timestamp"),
             }
         
         except requests.exceptions.Timeout:
-            logger.error(f"❌ Timeout sending email to {to_email}")
+            logger.error(f"❌ Timeout sending batch email to {len(recipients)} recipients")
             raise
         except requests.exceptions.ConnectionError:
+            logger.error(f"❌ Connection error sending batch email to {len(recipients)} recipients")
+            raise
+        except MailgunAPIError:
+            # Already logged with the response body
+            raise
+        except Exception as e:
+            logger.error(f"❌ Failed to send batch email to {len(recipients)} recipients: {str(e)}")
+            raise
+    
+    def _build_message_data(
+        self,
+        to_email: str,
+        to_name: Optional[str],
+        subject: str,
+        html_body: str,
+        text_body: Optional[str],
+        reply_to: Optional[str],
+        cc: Optional[List[str]],
+        bcc: Optional[List[str]],
+        tags: Optional[List[str]],
+        tracking: bool,
+    ) -> Dict:
+        """Build the Mailgun form fields for a single message"""
+        _check_addresses(to_email, *(cc or ()), *(bcc or ()))
+        
+        # formataddr quotes display names, so a comma in "Doe, John" isn't
+        # read by Mailgun as a separator between two addresses
+        recipient = formataddr((to_name, to_email)) if to_name else to_email
+        
+        if not text_body:
+            text_body = self._strip_html(html_body)
+        
+        data = dict(self._base_payload)
+        data["to"] = recipient
+        data["subject"] = subject
+        data["html"] = html_body
+        data["text"] = text_body
+        
+        if reply_to:
+            data["h:Reply-To"] = reply_to
+        
+        if cc:
+            data["cc"] = ", ".join(cc)
+        
+        if bcc:
+            data["bcc"] = ", ".join(bcc)
+        
+        if tags:
+            data["o:tag"] = tags
+        
+        if tracking:
+            data.update(self._tracking_fields)
+        
+        return data
+    
+    @staticmethod
+    def _handle_send_response(response, to_email: str, to_name: Optional[str], subject: str) -> Dict:
+        """Turn a Mailgun response (requests or httpx) into the send result dict"""
+        if response.status_code not in [200, 201]:
+            logger.error(f"❌ Mailgun API error: {response.status_code}")
+            logger.error(f"Response: {response.text}")
+            raise MailgunAPIError(response.status_code, f"Mailgun API returned {response.status_code}: {response.text}")
+        
+        result = orjson.loads(response.content)
+        message_id = result.get("id", "unknown")
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Email sent to=%s id=%s status=%s",
+                to_email, message_id, result.get("message", "Queued"),
+            )
+        
+        return {
+            "success": True,
+            "message_id": message_id,
+            "to_email": to_email,
+            "to_name": to_name,
+            "subject": subject,
+            "status": "sent",
+            "timestamp": result.get("timestamp"),
+        }
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Shared HTTP/2 client for async sends"""
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(
+                http2=True,
+                auth=self.auth,
+                base_url=f"https://api.mailgun.net/v3/{self.domain}",
+                timeout=httpx.Timeout(10.0, connect=3.0),
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+            )
+        return self._aclient
+    
+    async def send_email_async(
+        self,
+        to_email: str,
+        to_name: Optional[str] = None,
+        subject: str = "",
+        html_body: str = "",
+        text_body: Optional[str] = None,
+        reply_to: Optional[str] = None,
+        cc: Optional[List[str]] = None,
+        bcc: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        tracking: bool = True,
+    ) -> Dict:
+        """
+        Async variant of send_email over the shared HTTP/2 client.
+        Takes the same arguments and returns the same result dict.
+        """
+        try:
+            data = self._build_message_data(
+                to_email, to_name, subject, html_body, text_body,
+                reply_to, cc, bcc, tags, tracking,
+            )
+            response = await self._get_async_client().post(
+                "/messages", content=_encode_form(data), headers=_FORM_HEADERS
+            )
+            return self._handle_send_response(response, to_email, to_name, subject)
+        
+        except httpx.TimeoutException:
+            logger.error(f"❌ Timeout sending email to {to_email}")
+            raise
+        except httpx.ConnectError:
             logger.error(f"❌ Connection error sending email to {to_email}")
             raise
+        except MailgunAPIError:
+            # Already logged with the response body
+            raise
         except Exception as e:
             logger.error(f"❌ Failed to send email to {to_email}: {str(e)}")
             raise
-     
-    @staticmethod
-    def _strip_html(html_text: str) -> str:
-        """Convert HTML to plain text by removing all tags"""
-        return re.sub('<[^<]+?>', '', html_text)
+    
+    async def send_many(self, messages: List[Dict], concurrency: int = 10) -> List:
+        """
+        Send several individual emails concurrently.
+        
+        Args:
+            messages: List of send_email keyword-argument dicts
+            concurrency: Maximum number of in-flight requests
+        
+        Returns:
+            List aligned with `messages`: the send result dict, or the
+            exception raised for that message
+        """
+        sem = asyncio.Semaphore(concurrency)
+        
+        async def send(message: Dict):
+            async with sem:
+                return await self.send_email_async(**message)
+        
+        return await asyncio.gather(*(send(m) for m in messages), return_exceptions=True)
+    
+    async def aclose(self) -> None:
+        """Close the async HTTP client (e.g. on application shutdown)"""
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+    
+    @classmethod
+    @functools.lru_cache(maxsize=256)
+    def _strip_html(cls, html_text: str) -> str:
+        """
+        Convert HTML to plain text (drops script/style content and decodes entities).
+        Cached: batch and repeated campaign sends reuse the same HTML body.
+        """
+        if HTMLParser is not None:
+            tree = HTMLParser(html_text)
+            for node in tree.css("script, style"):
+                node.decompose()
+            return tree.text(separator=" ")
+        return cls._TAG_RE.sub('', html_text)
 
 
-# Initialize service singleton
-try:
-    mailgun_service = MailgunService()
-except Exception as e:
-    logger.error(f"Failed to initialize Mailgun service: {str(e)}")
-    mailgun_service = None
\ No newline at end of file
+# Service singleton, created on first use so importing this module stays cheap
+mailgun_service: Optional[MailgunService] = None
+_mailgun_service_lock = threading.Lock()
+
+
+def get_mailgun_service() -> MailgunService:
+    """
+    Get the shared Mailgun service so every send uses the same connection pool.
+    
+    Raises:
+        ValueError: If MAILGUN_API_KEY / MAILGUN_DOMAIN are not configured
+    """
+    global mailgun_service
+    if mailgun_service is None:
+        with _mailgun_service_lock:
+            if mailgun_service is None:
+                mailgun_service = MailgunService()
+    return mailgun_service
\ No newline at end of file
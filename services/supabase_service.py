@@ -9,8 +9,12 @@ This service provides only:
 - Client initialization with service role
 - Client retrieval with user authentication
 """
+import hashlib
 import os
+import threading
 from typing import Optional
+import httpx
+from cachetools import TTLCache
 from dotenv import load_dotenv
 import logging
 
@@ -19,9 +23,29 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Connection settings, read once at import (main.py refuses to start when
+# either is missing, so misconfigured deploys fail before serving requests)
+SUPABASE_URL = os.getenv("SUPABASE_URL", "").strip()
+SUPABASE_KEY = os.getenv("SUPABASE_KEY", "").strip()
+
+# User-authenticated clients are reused per JWT for up to an hour (Supabase's
+# default token lifetime) instead of building a new client per request
+USER_CLIENT_CACHE_SIZE = 256
+USER_CLIENT_CACHE_TTL = 60 * 60
+
+# Connection pool for the shared service-role client. supabase-py's default
+# httpx pool (10 connections / 5 keep-alive) throttles concurrent lead
+# lookups and forces new TLS handshakes under load
+SUPABASE_HTTP_LIMITS = httpx.Limits(
+    max_connections=100, max_keepalive_connections=50, keepalive_expiry=30
+)
+# A custom httpx client replaces supabase-py's own timeout settings, so keep
+# its PostgREST default (seconds)
+SUPABASE_HTTP_TIMEOUT = 120
+
 # Import supabase
 try:
-    from supabase import create_client, Client
+    from supabase import create_client, Client, ClientOptions
     SUPABASE_AVAILABLE = True
 except ImportError:
     SUPABASE_AVAILABLE = False
@@ -39,21 +63,39 @@ class SupabaseService:
         if not SUPABASE_AVAILABLE:
             raise RuntimeError("Supabase client is not installed")
         
-        self.url = os.getenv("SUPABASE_URL", "").strip()
-        self.key = os.getenv("SUPABASE_KEY", "").strip()
+        self.url = SUPABASE_URL
+        self.key = SUPABASE_KEY
         
         if not self.url or not self.key:
             logger.error(f"SUPABASE_URL: {bool(self.url)}, SUPABASE_KEY: {bool(self.key)}")
             raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in .env file")
         
         try:
-            logger.info(f"Initializing Supabase client with URL: {self.url[:50]}...")
+            logger.debug("Initializing Supabase client with URL: %.50s...", self.url)
             # Initialize with service key (admin role)
-            self.client: Client = create_client(self.url, self.key)
+            self.client: Client = create_client(
+                self.url, self.key, options=self._pooled_options()
+            )
             logger.info(" Supabase client initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Supabase client: {e}")
             raise
+        
+        # Keyed by a digest of the token so raw JWTs aren't kept in memory
+        self._user_clients = TTLCache(maxsize=USER_CLIENT_CACHE_SIZE, ttl=USER_CLIENT_CACHE_TTL)
+        self._user_clients_lock = threading.Lock()
+    
+    @staticmethod
+    def _pooled_options() -> "ClientOptions":
+        """Client options whose shared httpx client uses SUPABASE_HTTP_LIMITS."""
+        return ClientOptions(
+            httpx_client=httpx.Client(
+                timeout=SUPABASE_HTTP_TIMEOUT,
+                follow_redirects=True,
+                http2=True,
+                limits=SUPABASE_HTTP_LIMITS,
+            )
+        )
     
     def _get_client(self, user_token: Optional[str] = None) -> Client:
         """
@@ -68,27 +110,36 @@ class SupabaseService:
             Authenticated Supabase client
         """
         if user_token:
-            # Create a user-authenticated client
-            # This respects RLS policies for the authenticated user
-            user_client = create_client(self.url, self.key)
-            user_client.postgrest.auth(user_token)
-            logger.info(" Using user-authenticated client")
+            # User-authenticated client (respects RLS policies for the user),
+            # cached per token so its HTTP pools and TLS sessions are reused
+            key = hashlib.blake2b(user_token.encode(), digest_size=16).hexdigest()
+            with self._user_clients_lock:
+                user_client = self._user_clients.get(key)
+            if user_client is None:
+                user_client = create_client(self.url, self.key)
+                user_client.postgrest.auth(user_token)
+                with self._user_clients_lock:
+                    self._user_clients[key] = user_client
             return user_client
         
         # Use service role client (admin, bypasses RLS)
-        logger.info(" Using service role client (admin)")
         return self.client
 
 
-# Global service instance
+# Global service instance. The service-role client is shared process-wide
+# (its httpx connection pool is safe to use from worker threads), so the lock
+# only guards first-time creation when several threads race at startup.
 _supabase_service: Optional[SupabaseService] = None
+_supabase_service_lock = threading.Lock()
 
 
 def get_supabase_service() -> SupabaseService:
     """Get or create Supabase service instance"""
     global _supabase_service
     if _supabase_service is None:
-        _supabase_service = SupabaseService()
+        with _supabase_service_lock:
+            if _supabase_service is None:
+                _supabase_service = SupabaseService()
     return _supabase_service
 
 
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Tests for campaign sending: queue claiming in the send cron, Mailgun batch
+chunking and batch template placeholders
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+# Add project root to path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from services import cron_service
+from services.campaign_email_service import CampaignEmailService
+from services.cron_service import compile_batch_template, replace_email_placeholders
+from services.mailgun_service import MailgunService, chunk_batch_recipients
+
+
+class FakeQuery:
+    """Chainable stand-in for a supabase-py query builder"""
+    
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.filters = {}
+        self.values = None
+    
+    def select(self, *args, **kwargs):
+        return self
+    
+    def update(self, values):
+        self.values = values
+        return self
+    
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+    
+    def lte(self, column, value):
+        return self
+    
+    def order(self, *args, **kwargs):
+        return self
+    
+    def limit(self, count):
+        return self
+    
+    def single(self):
+        return self
+    
+    def execute(self):
+        return self.client.respond(self)
+
+
+class FakeSupabase:
+    """Records RPC calls and queue updates; serves claimed rows and campaign emails"""
+    
+    def __init__(self, claimed, campaign_emails):
+        self.claimed = claimed
+        self.campaign_emails = campaign_emails
+        self.rpc_calls = []
+        self.updates = {}
+    
+    def rpc(self, name, params):
+        self.rpc_calls.append((name, params))
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=self.claimed))
+    
+    def table(self, name):
+        return FakeQuery(self, name)
+    
+    def respond(self, query):
+        if query.values is not None:
+            self.updates[query.filters["id"]] = query.values
+            return SimpleNamespace(data=[])
+        if query.table == "campaign_emails":
+            key = (query.filters["campaign_id"], query.filters["send_day"])
+            email = self.campaign_emails.get(key)
+            return SimpleNamespace(data=[email] if email else [])
+        return SimpleNamespace(data=None)
+
+
+class FakeMailgun:
+    def __init__(self):
+        self.sent = []
+    
+    def send_email(self, **kwargs):
+        self.sent.append(kwargs)
+        return {"success": True, "message_id": f"<{len(self.sent)}@mailgun>"}
+
+
+class FakeMailgunSession:
+    """Records the form fields of each Mailgun POST and answers 200"""
+    
+    def __init__(self):
+        self.posts = []
+    
+    def post(self, url, data=None, **kwargs):
+        self.posts.append(parse_qs(data.decode("ascii")))
+        return SimpleNamespace(status_code=200, content=b'{"id": "<1@mailgun>"}', text="")
+
+
+def _mailgun_with_fake_session(monkeypatch):
+    monkeypatch.setenv("MAILGUN_API_KEY", "key-test")
+    monkeypatch.setenv("MAILGUN_DOMAIN", "mg.example.com")
+    service = MailgunService()
+    service.session = FakeMailgunSession()
+    return service
+
+
+def _run_send_pending(monkeypatch, claimed, campaign_emails):
+    supabase = FakeSupabase(claimed, campaign_emails)
+    mailgun = FakeMailgun()
+    monkeypatch.setattr(cron_service, "get_supabase_client", lambda: supabase)
+    monkeypatch.setattr(cron_service, "_get_mailgun", lambda: mailgun)
+    stats = asyncio.run(cron_service.send_pending_emails())
+    return stats, supabase, mailgun
+
+
+def test_send_pending_emails_claims_rows_before_sending(monkeypatch):
+    claimed = [
+        {"id": "q1", "campaign_id": "c1", "send_day": 0,
+         "recipient_email": "ann@example.com", "recipient_name": "Ann"},
+    ]
+    campaign_emails = {
+        ("c1", 0): {"subject": "Hi {{recipient_name}}", "body": "<p>{{city}}</p>", "user_id": None},
+    }
+    
+    stats, supabase, mailgun = _run_send_pending(monkeypatch, claimed, campaign_emails)
+    
+    assert supabase.rpc_calls == [
+        ("claim_pending_batch", {"worker_id": cron_service.WORKER_ID, "batch_size": 100})
+    ]
+    assert [m["to_email"] for m in mailgun.sent] == ["ann@example.com"]
+    assert mailgun.sent[0]["subject"] == "Hi Ann"
+    assert mailgun.sent[0]["html_body"] == "<p>your city</p>"
+    assert supabase.updates["q1"]["status"] == "sent"
+    assert stats["sent"] == 1 and stats["failed"] == 0
+
+
+def test_send_pending_emails_fails_claimed_rows_without_campaign_email(monkeypatch):
+    claimed = [
+        {"id": "q1", "campaign_id": "c1", "send_day": 10,
+         "recipient_email": "ann@example.com", "recipient_name": "Ann"},
+    ]
+    
+    stats, supabase, mailgun = _run_send_pending(monkeypatch, claimed, {})
+    
+    # The claimed ('sending') row must not be left for the stale-claim sweep
+    assert mailgun.sent == []
+    assert supabase.updates["q1"]["status"] == "failed"
+    assert stats["failed"] == 1 and stats["sent"] == 0
+
+
+def test_chunk_batch_recipients_respects_size():
+    recipients = [{"email": f"lead{i}@example.com"} for i in range(5)]
+    
+    chunks = chunk_batch_recipients(recipients, 2)
+    
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert [r for chunk in chunks for r in chunk] == recipients
+
+
+def test_chunk_batch_recipients_splits_repeated_addresses():
+    recipients = [
+        {"email": "a@example.com", "agent_name": "One"},
+        {"email": "b@example.com", "agent_name": "One"},
+        {"email": "a@example.com", "agent_name": "Two"},
+    ]
+    
+    chunks = chunk_batch_recipients(recipients, 1000)
+    
+    # recipient-variables are keyed by email, so a repeat starts a new chunk
+    assert chunks == [recipients[:2], recipients[2:]]
+
+
+def test_chunk_batch_recipients_empty():
+    assert chunk_batch_recipients([], 1000) == []
+
+
+def test_compile_batch_template_uses_recipient_variables():
+    template = "Hi {{recipient_name}} from {{agent_name}} at {{company}} in {{city}}, {{year}}"
+    
+    assert compile_batch_template(template) == (
+        "Hi %recipient.recipient_name% from %recipient.agent_name% at "
+        "%recipient.company% in %recipient.city%, %recipient.year%"
+    )
+
+
+def test_compile_batch_template_leaves_unknown_placeholders():
+    assert compile_batch_template("{{unknown}} {name}") == "{{unknown}} {name}"
+
+
+def test_replace_email_placeholders():
+    text = "{{recipient_name}} / {{city}} / {{agent_name}} / {{company}}"
+    
+    assert replace_email_placeholders(
+        text, recipient_name="Ann", city="Toronto", agent_name="Sam", company="Acme"
+    ) == "Ann / Toronto / Sam / Acme"
+
+
+def test_send_batch_quotes_display_names(monkeypatch):
+    mailgun = _mailgun_with_fake_session(monkeypatch)
+    recipients = [
+        {"email": "john@example.com", "name": "Doe, John"},
+        {"email": "ann@example.com", "name": 'Ann "Annie" Lee'},
+        {"email": "bob@example.com"},
+    ]
+    
+    result = mailgun.send_batch(recipients, subject="Hi %recipient.name%", html_body="<p>Hi</p>")
+    
+    # An unquoted comma would make Mailgun read "Doe" as a separate address
+    assert mailgun.session.posts[0]["to"] == [
+        '"Doe, John" <john@example.com>',
+        '"Ann \\"Annie\\" Lee" <ann@example.com>',
+        "bob@example.com",
+    ]
+    assert result["recipient_count"] == 3
+
+
+def test_send_email_quotes_display_name(monkeypatch):
+    mailgun = _mailgun_with_fake_session(monkeypatch)
+    
+    mailgun.send_email("john@example.com", to_name="Doe, John", subject="Hi", html_body="<p>Hi</p>")
+    
+    assert mailgun.session.posts[0]["to"] == ['"Doe, John" <john@example.com>']
+
+
+def test_send_to_leads_batched_counts_leads_with_comma_names(monkeypatch):
+    mailgun = _mailgun_with_fake_session(monkeypatch)
+    leads = [
+        {"email": "john@example.com", "name": "Doe, John"},
+        {"email": "ann@example.com", "name": "Ann"},
+        {"email": None, "name": "No Email"},
+    ]
+    
+    sent, failed = CampaignEmailService._send_to_leads_batched(
+        mailgun, leads, "Hi {recipient_name}", "<p>Hello {{recipient_name}}</p>", "",
+        ["day_0"], "Toronto", "Sam", "Acme",
+    )
+    
+    assert (sent, failed) == (2, 1)
+    assert mailgun.session.posts[0]["to"] == ['"Doe, John" <john@example.com>', "Ann <ann@example.com>"]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for the vectorized lead cleaning in utils/cleaning.py
+"""
+
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+# Add project root to path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from utils.cleaning import clean_leads_data, detect_column_mappings
+
+
+def test_clean_leads_data_normalizes_fields():
+    df = pd.DataFrame({
+        "Full Name": ["  jane   DOE "],
+        "Email Address": [" Jane@Example.COM "],
+        "Phone Number": ["(416) 555-0101"],
+        "Street Address": [" 12  King  St "],
+    })
+    
+    leads, stats = clean_leads_data(df)
+    
+    assert leads == [{
+        "email": "jane@example.com",
+        "name": "Jane Doe",
+        "phone": "4165550101",
+        "address": "12 King St",
+    }]
+    assert stats["cleaned_count"] == 1
+
+
+def test_clean_leads_data_counts_empty_duplicate_and_invalid_rows():
+    df = pd.DataFrame({
+        "name": ["Ann", "Ann Again", "", "Bob", "Cy", None],
+        "email": ["ann@example.com", "ANN@example.com", "x@example.com", "not-an-email", "cy@example.org", "d@example.com"],
+    })
+    
+    leads, stats = clean_leads_data(df)
+    
+    assert [lead["email"] for lead in leads] == ["ann@example.com", "cy@example.org"]
+    assert stats == {
+        "original_count": 6,
+        "invalid_emails": 1,
+        "duplicates_removed": 1,
+        "empty_rows": 2,
+        "cleaned_count": 2,
+    }
+
+
+def test_clean_leads_data_drops_short_phones_and_missing_optional_columns():
+    df = pd.DataFrame({
+        "name": ["Ann", "Bob"],
+        "email": ["ann@example.com", "bob@example.com"],
+        "phone": ["123", None],
+    })
+    
+    leads, _ = clean_leads_data(df)
+    
+    assert [(lead["phone"], lead["address"]) for lead in leads] == [(None, None), (None, None)]
+
+
+def test_clean_leads_data_requires_email_and_name_columns():
+    with pytest.raises(HTTPException) as missing_email:
+        clean_leads_data(pd.DataFrame({"name": ["Ann"]}))
+    assert missing_email.value.status_code == 400
+    
+    with pytest.raises(HTTPException) as missing_name:
+        clean_leads_data(pd.DataFrame({"email": ["ann@example.com"]}))
+    assert missing_name.value.status_code == 400
+
+
+def test_clean_leads_data_rejects_empty_file():
+    with pytest.raises(HTTPException):
+        clean_leads_data(pd.DataFrame())
+
+
+def test_detect_column_mappings():
+    df = pd.DataFrame(columns=["Contact Name", "E-mail", "Mobile", "City"])
+    
+    assert detect_column_mappings(df) == {
+        "email": "E-mail",
+        "name": "Contact Name",
+        "phone": "Mobile",
+        "address": "City",
+    }
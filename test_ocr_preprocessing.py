@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for the image downscaling done before Vision OCR
+"""
+
+import io
+import os
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+# Add project root to path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from services import email_generation
+from services.email_generation import _preprocess_for_ocr
+
+
+def _encode(img, fmt, **kwargs):
+    buf = io.BytesIO()
+    img.save(buf, fmt, **kwargs)
+    return buf.getvalue()
+
+
+def _decode(data):
+    return Image.open(io.BytesIO(data))
+
+
+def test_small_images_are_sent_unchanged():
+    data = _encode(Image.new("RGB", (10, 10), "white"), "PNG")
+    
+    assert _preprocess_for_ocr(data) is data
+
+
+def test_exif_orientation_is_applied(monkeypatch):
+    monkeypatch.setattr(email_generation, "OCR_MIN_BYTES", 0)
+    img = Image.new("RGB", (400, 200), "white")
+    exif = img.getexif()
+    exif[0x0112] = 6  # Orientation: rotate 90 CW to display
+    data = _encode(img, "PNG", exif=exif)
+    
+    result = _decode(_preprocess_for_ocr(data))
+    
+    # The JPEG carries no orientation tag, so the pixels must be upright
+    assert result.format == "JPEG"
+    assert result.size == (200, 400)
+
+
+def test_transparent_background_becomes_white(monkeypatch):
+    monkeypatch.setattr(email_generation, "OCR_MIN_BYTES", 0)
+    # Noise under a fully transparent background keeps the PNG larger than
+    # the re-encoded JPEG, so the preprocessed image is the one returned
+    img = Image.frombytes("RGB", (400, 400), os.urandom(400 * 400 * 3)).convert("RGBA")
+    img.putalpha(0)
+    img.paste((0, 0, 0, 255), (180, 180, 220, 220))
+    data = _encode(img, "PNG")
+    
+    result = _decode(_preprocess_for_ocr(data))
+    
+    assert result.format == "JPEG"
+    assert min(result.getpixel((5, 5))) > 240
+    assert max(result.getpixel((200, 200))) < 15
+
+
+def test_palette_transparency_becomes_white(monkeypatch):
+    monkeypatch.setattr(email_generation, "OCR_MIN_BYTES", 0)
+    # Every palette entry except the last (black) is fully transparent
+    img = Image.frombytes("P", (400, 400), bytes(b % 255 for b in os.urandom(400 * 400)))
+    img.putpalette([0, 0, 0] * 256)
+    img.paste(255, (180, 180, 220, 220))
+    data = _encode(img, "PNG", transparency=bytes(255) + b"\xff")
+    
+    result = _decode(_preprocess_for_ocr(data))
+    
+    assert result.format == "JPEG"
+    assert min(result.getpixel((5, 5))) > 240
+    assert max(result.getpixel((200, 200))) < 15
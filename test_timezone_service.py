@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for recipient-timezone campaign scheduling in utils/timezone_service.py
+"""
+
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from utils.timezone_service import calculate_campaign_queue_times, get_recipient_timezone
+
+
+def _utc(schedule, day):
+    return datetime.fromisoformat(schedule[f"day_{day}"]["utc"])
+
+
+def test_first_send_is_window_start_on_creation_day():
+    # 06:00 in Toronto (EDT, UTC-4): the 8 AM window start is still ahead
+    created = datetime(2024, 6, 3, 10, 0, tzinfo=timezone.utc)
+    
+    schedule = calculate_campaign_queue_times(created, "America/Toronto")
+    
+    assert _utc(schedule, 0) == datetime(2024, 6, 3, 12, 0, tzinfo=timezone.utc)
+    assert schedule["day_0"]["timezone"] == "America/Toronto"
+
+
+def test_first_send_moves_to_next_day_after_window_start():
+    # 14:00 in Toronto: today's 8 AM has passed
+    created = datetime(2024, 6, 3, 18, 0, tzinfo=timezone.utc)
+    
+    schedule = calculate_campaign_queue_times(created, "America/Toronto")
+    
+    assert _utc(schedule, 0) == datetime(2024, 6, 4, 12, 0, tzinfo=timezone.utc)
+
+
+def test_later_touches_are_anchored_to_the_first_send():
+    created = datetime(2024, 6, 3, 10, 0, tzinfo=timezone.utc)
+    
+    schedule = calculate_campaign_queue_times(created, "America/Vancouver")
+    
+    first = _utc(schedule, 0)
+    assert list(schedule) == ["day_0", "day_10", "day_20", "day_30"]
+    for day in (10, 20, 30):
+        assert _utc(schedule, day) - first == timedelta(days=day)
+        assert schedule[f"day_{day}"]["local"].startswith("08:00 AM")
+
+
+def test_touches_keep_local_wall_time_across_dst():
+    # DST ends in Toronto on 2024-11-03, between day 0 and day 10
+    created = datetime(2024, 10, 28, 10, 0, tzinfo=timezone.utc)
+    
+    schedule = calculate_campaign_queue_times(created, "America/Toronto")
+    
+    assert _utc(schedule, 0) == datetime(2024, 10, 28, 12, 0, tzinfo=timezone.utc)
+    assert _utc(schedule, 10) == datetime(2024, 11, 7, 13, 0, tzinfo=timezone.utc)
+    assert schedule["day_0"]["local"] == "08:00 AM EDT"
+    assert schedule["day_10"]["local"] == "08:00 AM EST"
+
+
+def test_naive_creation_time_is_treated_as_utc():
+    naive = calculate_campaign_queue_times(datetime(2024, 6, 3, 10, 0), "America/Toronto")
+    aware = calculate_campaign_queue_times(
+        datetime(2024, 6, 3, 10, 0, tzinfo=timezone.utc), "America/Toronto"
+    )
+    
+    assert naive == aware
+
+
+def test_get_recipient_timezone_matches_city_case_insensitively():
+    assert get_recipient_timezone({"city": "  VANCOUVER "}) == "America/Vancouver"
+    assert get_recipient_timezone({"city": "Vancouver", "timezone": "Europe/London"}) == "Europe/London"
+    assert get_recipient_timezone({"city": "Nowhere"}) == "America/Toronto"
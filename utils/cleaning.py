@@ -1,37 +1,75 @@
-import pandas as pd
+from __future__ import annotations
+
 import io
+import importlib.util
 import logging
+import re
 from fastapi import HTTPException
-from typing import Tuple, List, Dict
-from utils.validation import (
-    is_valid_email, clean_email, clean_phone, 
-    clean_name, clean_address
-)
+from typing import TYPE_CHECKING, Tuple, List, Dict
+from utils.validation import EMAIL_PATTERN
+
+# pandas costs about half a second to import, so it is loaded by the functions
+# that need it on the first upload rather than at app startup
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+# Optional multi-threaded Arrow CSV reader (imported by pandas on first use)
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# Optional Rust-backed Excel reader (pandas engine='calamine', pandas >= 2.2)
+CALAMINE_AVAILABLE = importlib.util.find_spec("python_calamine") is not None
+
 def parse_csv_from_bytes(file_content: bytes) -> pd.DataFrame:
     """Parse CSV file from bytes"""
+    import pandas as pd
     try:
+        if PYARROW_AVAILABLE:
+            try:
+                return pd.read_csv(io.BytesIO(file_content), engine='pyarrow')
+            except Exception as e:
+                # Arrow is stricter (e.g. ragged rows); the C parser is more lenient
+                logger.warning(f"PyArrow CSV parse failed, retrying with default parser: {e}")
         df = pd.read_csv(io.BytesIO(file_content))
         return df
     except Exception as e:
         logger.error(f"Error parsing CSV: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(e)}")
 
+def contacts_to_dataframe(contacts: List[Dict]) -> pd.DataFrame:
+    """Convert contact dicts (e.g. from image extraction) into a DataFrame for clean_leads_data"""
+    import pandas as pd
+    return pd.DataFrame.from_records(contacts, columns=["name", "email", "phone", "city", "address"])
+
 def parse_excel_from_bytes(file_content: bytes) -> pd.DataFrame:
     """Parse Excel file from bytes"""
+    import pandas as pd
     try:
+        if CALAMINE_AVAILABLE:
+            try:
+                return pd.read_excel(io.BytesIO(file_content), engine='calamine')
+            except Exception as e:
+                # Fall back to openpyxl/xlrd for anything calamine rejects
+                logger.warning(f"Calamine Excel parse failed, retrying with default engine: {e}")
         df = pd.read_excel(io.BytesIO(file_content))
         return df
     except Exception as e:
         logger.error(f"Error parsing Excel: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid Excel file: {str(e)}")
 
+# Header patterns per field. Matching is a substring test, so the short
+# keywords also cover variants like email_address, phone_number, telephone,
+# full_address and street_address
+_COLUMN_PATTERNS = {
+    'email': re.compile(r'e-?mail'),
+    'name': re.compile(r'name'),
+    'phone': re.compile(r'phone|mobile|tel'),
+    'address': re.compile(r'address|street|location|city'),
+}
+
 def detect_column_mappings(df: pd.DataFrame) -> dict:
     """Detect email, name, phone, address columns from headers"""
-    headers = [col.lower().strip() for col in df.columns]
-    
     mappings = {
         'email': None,
         'name': None,
@@ -39,43 +77,27 @@ def detect_column_mappings(df: pd.DataFrame) -> dict:
         'address': None,
     }
     
-    # Validate that required columns exist
-    required_columns = {'email', 'name'}
-    
-    # Email column detection
-    email_keywords = ['email', 'e-mail', 'email_address', 'emailaddress']
-    for idx, header in enumerate(headers):
-        for keyword in email_keywords:
-            if keyword in header:
-                mappings['email'] = df.columns[idx]
-                break
-    
-    # Name column detection
-    name_keywords = ['name', 'full_name', 'fullname', 'contact_name', 'contactname', 'first_name', 'firstname']
-    for idx, header in enumerate(headers):
-        for keyword in name_keywords:
-            if keyword in header:
-                mappings['name'] = df.columns[idx]
-                break
-    
-    # Phone column detection
-    phone_keywords = ['phone', 'phone_number', 'phonenumber', 'mobile', 'mobile_number', 'mobilenumber', 'telephone', 'tel']
-    for idx, header in enumerate(headers):
-        for keyword in phone_keywords:
-            if keyword in header:
-                mappings['phone'] = df.columns[idx]
-                break
-    
-    # Address column detection
-    address_keywords = ['address', 'street', 'street_address', 'streetaddress', 'location', 'city', 'full_address', 'fulladdress']
-    for idx, header in enumerate(headers):
-        for keyword in address_keywords:
-            if keyword in header:
-                mappings['address'] = df.columns[idx]
-                break
+    # One pass over the headers; when several headers match a field the
+    # last one wins
+    for column in df.columns:
+        header = str(column).lower().strip()
+        for field, pattern in _COLUMN_PATTERNS.items():
+            if pattern.search(header):
+                mappings[field] = column
     
     return mappings
 
+def _text_column(df: pd.DataFrame, column) -> pd.Series:
+    """Column as stripped strings ('' for missing values or an unmapped column)"""
+    import pandas as pd
+    if column is None:
+        return pd.Series('', index=df.index)
+    return df[column].fillna('').astype(str).str.strip()
+
+def _collapse_whitespace(series: pd.Series) -> pd.Series:
+    """Collapse internal whitespace runs to single spaces"""
+    return series.str.replace(r'\s+', ' ', regex=True)
+
 def clean_leads_data(df: pd.DataFrame) -> Tuple[List[dict], dict]:
     """
     Clean and validate leads data
@@ -85,8 +107,6 @@ def clean_leads_data(df: pd.DataFrame) -> Tuple[List[dict], dict]:
         raise HTTPException(status_code=400, detail="File is empty")
     
     original_count = len(df)
-    seen_emails = set()
-    cleaned_leads = []
     stats = {
         'original_count': original_count,
         'invalid_emails': 0,
@@ -104,41 +124,40 @@ def clean_leads_data(df: pd.DataFrame) -> Tuple[List[dict], dict]:
     if not mappings['name']:
         raise HTTPException(status_code=400, detail="Name column is required. Please include a 'name' column in your file.")
     
-    for _, row in df.iterrows():
-        email = str(row.get(mappings['email'], '')).strip() if mappings['email'] else ''
-        name = str(row.get(mappings['name'], '')).strip() if mappings['name'] else ''
-        
-        if not email or pd.isna(email):
-            stats['empty_rows'] += 1
-            continue
-        
-        if not name or pd.isna(name):
-            stats['empty_rows'] += 1
-            continue
-        
-        if not is_valid_email(email):
-            stats['invalid_emails'] += 1
-            continue
-        
-        email_cleaned = clean_email(email)
-        
-        if email_cleaned in seen_emails:
-            stats['duplicates_removed'] += 1
-            continue
-        
-        seen_emails.add(email_cleaned)
-        
-        phone = str(row.get(mappings['phone'], '')).strip() if mappings['phone'] else ''
-        address = str(row.get(mappings['address'], '')).strip() if mappings['address'] else ''
-        
-        lead = {
-            'email': email_cleaned,
-            'name': clean_name(name) or None,
-            'phone': clean_phone(phone) or None,
-            'address': clean_address(address) or None,
+    # Column-wise cleaning (same rules as utils.validation, run in pandas'
+    # string kernels instead of per row)
+    email = _text_column(df, mappings['email'])
+    name = _text_column(df, mappings['name'])
+    
+    empty = (email == '') | (name == '')
+    stats['empty_rows'] = int(empty.sum())
+    
+    # De-duplicate before validating so the email pattern only runs once per
+    # distinct address
+    email = email.str.lower()
+    duplicate = ~empty & email.where(~empty).duplicated(keep='first')
+    stats['duplicates_removed'] = int(duplicate.sum())
+    
+    unique = ~empty & ~duplicate
+    valid = email[unique].str.match(EMAIL_PATTERN)
+    stats['invalid_emails'] = int((~valid).sum())
+    
+    keep = unique.to_numpy(copy=True)
+    keep[keep] = valid.to_numpy()
+    name = _collapse_whitespace(name[keep]).str.title()
+    phone = _text_column(df, mappings['phone'])[keep].str.replace(r'\D', '', regex=True)
+    phone = phone.where(phone.str.len() >= 7, '')
+    address = _collapse_whitespace(_text_column(df, mappings['address'])[keep])
+    
+    cleaned_leads = [
+        {
+            'email': e,
+            'name': n or None,
+            'phone': p or None,
+            'address': a or None,
         }
-        
-        cleaned_leads.append(lead)
+        for e, n, p, a in zip(email[keep].tolist(), name.tolist(), phone.tolist(), address.tolist())
+    ]
     
     stats['cleaned_count'] = len(cleaned_leads)
     
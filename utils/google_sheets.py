@@ -2,9 +2,38 @@ import re
 import logging
 from typing import Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
+# Sheet IDs follow this fixed path segment
+_SHEET_PATH = '/spreadsheets/d/'
+_SHEET_ID_RE = re.compile(r'[A-Za-z0-9_-]+')
+
+# Largest sheet export accepted; the download is streamed and aborted past this
+# instead of buffering an unbounded response
+MAX_SHEET_BYTES = 50 * 1024 * 1024
+_CHUNK_SIZE = 64 * 1024
+
+_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+}
+
+# Shared session so repeated imports reuse the docs.google.com connection
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    ),
+))
+
 
 def extract_sheet_id(url: str) -> Optional[str]:
     """    
@@ -20,11 +49,11 @@ def extract_sheet_id(url: str) -> Optional[str]:
         Sheet ID or None if URL is invalid
     """
     try:
-        pattern = r'/spreadsheets/d/([a-zA-Z0-9-_]+)'
-        match = re.search(pattern, url)
+        _, found, rest = url.partition(_SHEET_PATH)
+        match = _SHEET_ID_RE.match(rest) if found else None
         
         if match:
-            sheet_id = match.group(1)
+            sheet_id = match.group(0)
             logger.info(f"✅ Extracted sheet ID: {sheet_id[:20]}...")
             return sheet_id
         else:
@@ -57,19 +86,23 @@ def fetch_google_sheet_as_csv(url: str, timeout: int = 30) -> Optional[bytes]:
         
         gviz_url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv"
         
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        }
+        with _session.get(gviz_url, headers=_HEADERS, timeout=timeout, allow_redirects=True, stream=True) as response:
+            if response.status_code != 200:
+                logger.error(f"❌ Failed to fetch Google Sheet: HTTP {response.status_code}")
+                return None
+            
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_SHEET_BYTES:
+                    logger.error(f"❌ Google Sheet export exceeds {MAX_SHEET_BYTES} bytes")
+                    return None
+                chunks.append(chunk)
         
-        session = requests.Session()
-        response = session.get(gviz_url, headers=headers, timeout=timeout, allow_redirects=True)
-        
-        if response.status_code == 200:
-            logger.info(f"✅ Successfully fetched {len(response.content)} bytes from Google Sheets (gviz)")
-            return response.content
-        else:
-            logger.error(f"❌ Failed to fetch Google Sheet: HTTP {response.status_code}")
-            return None
+        content = b"".join(chunks)
+        logger.info(f"✅ Successfully fetched {len(content)} bytes from Google Sheets (gviz)")
+        return content
     
     except requests.Timeout:
         logger.error(f"⏱️  Timeout fetching Google Sheets (>{timeout}s)")
@@ -0,0 +1,32 @@
+"""
+Rate limiting helpers for outbound API calls (Mailgun, Gemini)
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Async token bucket allowing `rps` acquisitions per second on average,
+    with bursts of up to `rps` tokens.
+    """
+    
+    def __init__(self, rps: float):
+        self.rps = rps
+        self._capacity = max(rps, 1)
+        self._tokens = self._capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self) -> None:
+        """Wait until a token is available and consume it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._last) * self.rps)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rps)
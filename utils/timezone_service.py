@@ -3,11 +3,36 @@ Timezone Utility Service
 Handles timezone calculations for recipient-aware email scheduling
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Tuple
-import pytz
 from zoneinfo import ZoneInfo
 
+# ZoneInfo instances are cached by the stdlib per key, so the IANA data is
+# parsed once per timezone. Unlike pytz zones, datetime.replace() on a
+# ZoneInfo-aware value picks the correct DST offset for the new wall time.
+UTC = timezone.utc
+
+# City -> timezone, keyed by lowercased city name so lookups ignore case and
+# surrounding whitespace
+_CITY_TIMEZONES = {
+    "toronto": "America/Toronto",
+    "vancouver": "America/Vancouver",
+    "montreal": "America/Toronto",
+    "calgary": "America/Denver",
+    "edmonton": "America/Denver",
+    "ottawa": "America/Toronto",
+    "winnipeg": "America/Chicago",
+    "quebec": "America/Toronto",
+    "hamilton": "America/Toronto",
+    "kitchener": "America/Toronto",
+    "london": "America/Toronto",
+    "victoria": "America/Vancouver",
+    "halifax": "America/Halifax",
+    "st. john's": "America/St_Johns",
+    "saskatoon": "America/Chicago",
+    "regina": "America/Chicago",
+}
+
 
 def get_recipient_timezone(lead_data: dict) -> str:
     """
@@ -25,28 +50,9 @@ def get_recipient_timezone(lead_data: dict) -> str:
         return lead_data["timezone"]
     
     # Otherwise, map city to timezone if available
-    city_timezone_map = {
-        "Toronto": "America/Toronto",
-        "Vancouver": "America/Vancouver",
-        "Montreal": "America/Toronto",
-        "Calgary": "America/Denver",
-        "Edmonton": "America/Denver",
-        "Ottawa": "America/Toronto",
-        "Winnipeg": "America/Chicago",
-        "Quebec": "America/Toronto",
-        "Hamilton": "America/Toronto",
-        "Kitchener": "America/Toronto",
-        "London": "America/Toronto",
-        "Victoria": "America/Vancouver",
-        "Halifax": "America/Halifax",
-        "St. John's": "America/St_Johns",
-        "Saskatoon": "America/Chicago",
-        "Regina": "America/Chicago",
-    }
-    
-    city = lead_data.get("city", "")
-    if city in city_timezone_map:
-        return city_timezone_map[city]
+    city = (lead_data.get("city") or "").strip().lower()
+    if city in _CITY_TIMEZONES:
+        return _CITY_TIMEZONES[city]
     
     # Default to Toronto timezone
     return "America/Toronto"
@@ -78,10 +84,10 @@ def calculate_send_time_in_timezone(
         # Returns approximately 2024-01-11 13:00:00 UTC (8 AM Toronto time on Jan 11)
     """
     if not base_utc_time.tzinfo:
-        base_utc_time = base_utc_time.replace(tzinfo=pytz.UTC)
+        base_utc_time = base_utc_time.replace(tzinfo=UTC)
     
     # Get timezone object
-    tz = pytz.timezone(target_timezone)
+    tz = ZoneInfo(target_timezone)
     
     # Convert base UTC time to recipient's local time
     local_time = base_utc_time.astimezone(tz)
@@ -94,7 +100,7 @@ def calculate_send_time_in_timezone(
         target_local = target_local + timedelta(days=1)
     
     # Convert back to UTC
-    send_utc = target_local.astimezone(pytz.UTC)
+    send_utc = target_local.astimezone(UTC)
     
     return send_utc
 
@@ -118,9 +124,9 @@ def is_within_send_window(
         True if time is within send window, False otherwise
     """
     if not recipient_utc_time.tzinfo:
-        recipient_utc_time = recipient_utc_time.replace(tzinfo=pytz.UTC)
+        recipient_utc_time = recipient_utc_time.replace(tzinfo=UTC)
     
-    tz = pytz.timezone(recipient_timezone)
+    tz = ZoneInfo(recipient_timezone)
     local_time = recipient_utc_time.astimezone(tz)
     
     return start_hour <= local_time.hour < end_hour
@@ -147,9 +153,9 @@ def get_next_valid_send_time(
         Next valid send time in UTC
     """
     if not current_utc_time.tzinfo:
-        current_utc_time = current_utc_time.replace(tzinfo=pytz.UTC)
+        current_utc_time = current_utc_time.replace(tzinfo=UTC)
     
-    tz = pytz.timezone(recipient_timezone)
+    tz = ZoneInfo(recipient_timezone)
     local_time = current_utc_time.astimezone(tz)
     
     # If before start window, move to start_hour today
@@ -163,7 +169,7 @@ def get_next_valid_send_time(
         return current_utc_time
     
     # Convert back to UTC
-    return target_local.astimezone(pytz.UTC)
+    return target_local.astimezone(UTC)
 
 
 def get_local_time_display(
@@ -183,9 +189,9 @@ def get_local_time_display(
         Formatted time string in recipient's timezone
     """
     if not utc_time.tzinfo:
-        utc_time = utc_time.replace(tzinfo=pytz.UTC)
+        utc_time = utc_time.replace(tzinfo=UTC)
     
-    tz = pytz.timezone(timezone_str)
+    tz = ZoneInfo(timezone_str)
     local_time = utc_time.astimezone(tz)
     
     return local_time.strftime(format_str)
@@ -216,32 +222,28 @@ def calculate_campaign_queue_times(
         }
     """
     if not campaign_created_at.tzinfo:
-        campaign_created_at = campaign_created_at.replace(tzinfo=pytz.UTC)
+        campaign_created_at = campaign_created_at.replace(tzinfo=UTC)
+    
+    tz = ZoneInfo(recipient_timezone)
+    
+    # First send: window start on the creation day in the recipient's local
+    # time, or the next day if that has already passed. Later touches keep
+    # the same local wall time N days on (ZoneInfo resolves each DST offset),
+    # so every send lands exactly at the window start.
+    local_created = campaign_created_at.astimezone(tz)
+    first_send = local_created.replace(hour=send_window_start, minute=0, second=0, microsecond=0)
+    if first_send < local_created:
+        first_send += timedelta(days=1)
     
     schedule = {}
     
     for day_offset in [0, 10, 20, 30]:
-        # Calculate base time (day offset from campaign creation)
-        base_utc = campaign_created_at + timedelta(days=day_offset)
-        
-        # Calculate send time in recipient's send window
-        send_utc = calculate_send_time_in_timezone(
-            base_utc,
-            recipient_timezone,
-            target_hour=send_window_start,
-            target_minute=0,
-        )
-        
-        # If outside window, get next valid time
-        if not is_within_send_window(send_utc, recipient_timezone, send_window_start, send_window_end):
-            send_utc = get_next_valid_send_time(send_utc, recipient_timezone, send_window_start, send_window_end)
-        
-        local_display = get_local_time_display(send_utc, recipient_timezone)
+        local_send = first_send + timedelta(days=day_offset)
         
         schedule[f"day_{day_offset}"] = {
-            "utc": send_utc.isoformat(),
-            "local": local_display,
+            "utc": local_send.astimezone(UTC).isoformat(),
+            "local": local_send.strftime("%I:%M %p %Z"),
             "timezone": recipient_timezone,
         }
     
-    return schedule
\ No newline at end of file
+    return schedule
@@ -1,12 +1,18 @@
 import re
 
+# Email format accepted for leads (also used by the vectorized cleaner)
+EMAIL_PATTERN = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+_EMAIL_RE = re.compile(EMAIL_PATTERN)
+_NONDIGIT_RE = re.compile(r'\D')
+# Deletion table for ASCII input: drops everything except 0-9
+_ASCII_NONDIGITS = str.maketrans('', '', ''.join(chr(c) for c in range(128) if not chr(c).isdigit()))
+
 def is_valid_email(email: str) -> bool:
     """Validate email format"""
     if not email or not isinstance(email, str):
         return False
     
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email.strip().lower()) is not None
+    return _EMAIL_RE.match(email.strip().lower()) is not None
 
 def clean_email(email: str) -> str:
     """Clean and normalize email"""
@@ -18,7 +24,9 @@ def clean_phone(phone: str) -> str:
     """Clean phone number - remove special chars but keep digits"""
     if not phone:
         return ""
-    cleaned = re.sub(r'\D', '', str(phone))
+    phone = str(phone)
+    # translate is a single C pass; the regex also handles non-ASCII digits
+    cleaned = phone.translate(_ASCII_NONDIGITS) if phone.isascii() else _NONDIGIT_RE.sub('', phone)
     return cleaned if len(cleaned) >= 7 else ""
 
 def clean_name(name: str) -> str: